@@ -0,0 +1,226 @@
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.synthetic import SHAPES, build_database, database_path, name_of, sample_ids, supports
+from models.category import Category
+from models.tree_index import tree_index
+from utils import tree_utils
+from utils.tree_export import export_tree
+
+ROOT_ID = 1
+DEFAULT_SIZES = (1000, 10000, 100000)
+REGRESSION_THRESHOLD = 1.25
+
+
+class BenchmarkContext:
+    def __init__(self, size: int, samples: List[int], crud_ops: int, work_dir: Path):
+        self.size = size
+        self.samples = samples
+        self.crud_ops = crud_ops
+        self.work_dir = work_dir
+        self.created: List[int] = []
+
+
+# Каждая функция возвращает число выполненных вызовов: время делится на него
+def bench_index_load(ctx: BenchmarkContext) -> int:
+    tree_index.invalidate()
+    tree_index.load()
+    return 1
+
+
+def bench_build_category_tree(ctx: BenchmarkContext) -> int:
+    tree_utils.build_category_tree(ROOT_ID)
+    return 1
+
+
+def bench_get_category_path(ctx: BenchmarkContext) -> int:
+    for category_id in ctx.samples:
+        tree_utils.get_category_path(category_id)
+    return len(ctx.samples)
+
+
+def bench_get_tree_statistics(ctx: BenchmarkContext) -> int:
+    for category_id in ctx.samples:
+        tree_utils.get_tree_statistics(category_id)
+    return len(ctx.samples)
+
+
+def bench_find_category_by_name(ctx: BenchmarkContext) -> int:
+    for category_id in ctx.samples:
+        tree_utils.find_category_by_name(name_of(category_id))
+    return len(ctx.samples)
+
+
+def bench_export_text(ctx: BenchmarkContext) -> int:
+    export_tree(ROOT_ID, str(ctx.work_dir / "export.txt"), 'text')
+    return 1
+
+
+def bench_create(ctx: BenchmarkContext) -> int:
+    parents = ctx.samples[:ctx.crud_ops]
+    ctx.created = [Category.create("benchmark", "временный узел", parent_id) for parent_id in parents]
+    return len(parents)
+
+
+def bench_update(ctx: BenchmarkContext) -> int:
+    for category_id in ctx.created:
+        Category.update(category_id, "benchmark-updated", "обновлённый узел")
+    return len(ctx.created)
+
+
+def bench_delete(ctx: BenchmarkContext) -> int:
+    for category_id in ctx.created:
+        Category.delete(category_id)
+    deleted, ctx.created = len(ctx.created), []
+    return deleted
+
+
+# create, update и delete идут подряд в одном повторе: база возвращается в исходное состояние
+BENCHMARKS: Dict[str, Callable[[BenchmarkContext], int]] = {
+    'index_load': bench_index_load,
+    'build_category_tree': bench_build_category_tree,
+    'get_category_path': bench_get_category_path,
+    'get_tree_statistics': bench_get_tree_statistics,
+    'find_category_by_name': bench_find_category_by_name,
+    'export_text': bench_export_text,
+    'create': bench_create,
+    'update': bench_update,
+    'delete': bench_delete,
+}
+
+
+def _timed(fn: Callable[[BenchmarkContext], int], ctx: BenchmarkContext) -> float:
+    start = time.perf_counter()
+    calls = fn(ctx)
+    return (time.perf_counter() - start) / max(calls, 1)
+
+
+def run_shape(shape: str, size: int, names: List[str], repeat: int, samples: int,
+              crud_ops: int, seed: int, data_dir: Path) -> List[Dict]:
+    build_database(database_path(data_dir, shape, size, seed), shape, size, seed)
+    ctx = BenchmarkContext(size, sample_ids(size, samples, seed), crud_ops, data_dir)
+
+    timings = {name: [] for name in names}
+    for _ in range(repeat):
+        for name in names:
+            timings[name].append(_timed(BENCHMARKS[name], ctx))
+    if ctx.created:
+        bench_delete(ctx)
+
+    return [{
+        'shape': shape,
+        'size': size,
+        'benchmark': name,
+        'min': min(values),
+        'median': statistics.median(values),
+        'mean': statistics.fmean(values),
+        'repeat': len(values),
+    } for name, values in timings.items()]
+
+
+def compare(results: List[Dict], baseline: List[Dict], threshold: float) -> List[Dict]:
+    previous = {(r['shape'], r['size'], r['benchmark']): r for r in baseline}
+    rows = []
+    for result in results:
+        before = previous.get((result['shape'], result['size'], result['benchmark']))
+        if before is None or before['median'] <= 0:
+            continue
+        ratio = result['median'] / before['median']
+        rows.append({**result, 'baseline': before['median'], 'ratio': ratio, 'regression': ratio > threshold})
+    return rows
+
+
+def _format_seconds(value: float) -> str:
+    if value < 1e-3:
+        return f"{value * 1e6:9.1f} мкс"
+    if value < 1:
+        return f"{value * 1e3:9.2f} мс"
+    return f"{value:9.3f} с"
+
+
+def print_results(results: List[Dict], comparison: Optional[List[Dict]] = None):
+    ratios = {(r['shape'], r['size'], r['benchmark']): r for r in comparison or ()}
+    for result in results:
+        line = (f"{result['shape']:>9} {result['size']:>8} {result['benchmark']:<22} "
+                f"{_format_seconds(result['median'])}")
+        compared = ratios.get((result['shape'], result['size'], result['benchmark']))
+        if compared:
+            mark = "  РЕГРЕССИЯ" if compared['regression'] else ""
+            line += f"  x{compared['ratio']:.2f}{mark}"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки tree_utils и Category на синтетических деревьях")
+    parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=sorted(SHAPES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--samples', type=int, default=200, help="Число узлов для точечных запросов")
+    parser.add_argument('--crud-ops', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', type=Path, default=Path(tempfile.gettempdir()) / "knowledge-benchmarks",
+                        help="Каталог для сгенерированных баз, они переиспользуются")
+    parser.add_argument('--output', type=Path, help="Файл JSON с результатами")
+    parser.add_argument('--baseline', type=Path, help="JSON предыдущего запуска для сравнения")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Допустимое отношение медиан к базовому запуску")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    args.data_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    skipped = []
+    for shape in args.shapes:
+        for size in args.sizes:
+            if not supports(shape, size):
+                skipped.append({'shape': shape, 'size': size})
+                continue
+            results.extend(run_shape(shape, size, args.benchmarks, args.repeat, args.samples,
+                                     args.crud_ops, args.seed, args.data_dir))
+
+    comparison = None
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        comparison = compare(results, baseline['results'], args.threshold)
+
+    print_results(results, comparison)
+    for entry in skipped:
+        print(f"{entry['shape']:>9} {entry['size']:>8} пропущено: превышен лимит формы")
+
+    if args.output:
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'options': {
+                'repeat': args.repeat,
+                'samples': args.samples,
+                'crud_ops': args.crud_ops,
+                'seed': args.seed,
+            },
+            'results': results,
+            'skipped': skipped,
+        }
+        if comparison is not None:
+            report['comparison'] = comparison
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    return 1 if comparison and any(row['regression'] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import random
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from db import database
+from models.tree_index import tree_index
+
+Row = Tuple[int, str, Optional[str], Optional[int]]
+
+WORDS = (
+    "алгебра", "геометрия", "физика", "химия", "биология", "история", "литература",
+    "музыка", "живопись", "архитектура", "экономика", "право", "медицина", "астрономия",
+)
+
+BALANCED_FANOUT = 8
+# Closure-таблица растёт как n * глубина, поэтому цепочки ограничены по длине и размеру
+DEEP_CHAIN_LENGTH = 1000
+SHAPE_LIMITS = {'deep': 20000}
+
+
+def _deep(index: int, rng: random.Random) -> int:
+    # Цепочки длиной DEEP_CHAIN_LENGTH, каждая начинается от корня
+    return 0 if index % DEEP_CHAIN_LENGTH == 1 else index - 1
+
+
+def _wide(index: int, rng: random.Random) -> int:
+    return 0
+
+
+def _balanced(index: int, rng: random.Random) -> int:
+    return (index - 1) // BALANCED_FANOUT
+
+
+def _skewed(index: int, rng: random.Random) -> int:
+    # Ранние узлы получают больше детей: широкая верхушка и длинный хвост листьев
+    return int(index * rng.random() ** 3)
+
+
+SHAPES: Dict[str, Callable[[int, random.Random], int]] = {
+    'deep': _deep,
+    'wide': _wide,
+    'balanced': _balanced,
+    'skewed': _skewed,
+}
+
+
+def supports(shape: str, size: int) -> bool:
+    return size <= SHAPE_LIMITS.get(shape, size)
+
+
+def generate_rows(shape: str, size: int, seed: int = 0) -> Iterator[Row]:
+    # Позиция i получает id i + 1; родитель всегда раньше потомка
+    parent_of = SHAPES[shape]
+    rng = random.Random(seed)
+    for index in range(size):
+        parent_id = parent_of(index, rng) + 1 if index else None
+        word = WORDS[index % len(WORDS)]
+        description = f"{word} {WORDS[rng.randrange(len(WORDS))]} раздел {index}" if index % 3 else None
+        yield index + 1, f"{word}-{index}", description, parent_id
+
+
+def database_path(data_dir: Path, shape: str, size: int, seed: int) -> Path:
+    return Path(data_dir) / f"{shape}-{size}-{seed}.db"
+
+
+def build_database(path: Path, shape: str, size: int, seed: int = 0, chunk_size: int = 10000) -> Path:
+    # Готовая база переиспользуется между запусками: генерация миллиона узлов занимает минуты
+    path = Path(path)
+    if path.exists():
+        database.configure(path=path)
+        # База могла быть собрана до новых миграций; уже применённые init_db пропускает
+        database.init_db()
+        tree_index.invalidate()
+        return path
+
+    partial = path.with_suffix('.partial')
+    partial.unlink(missing_ok=True)
+    database.configure(path=partial)
+    database.init_db()
+    rows = generate_rows(shape, size, seed)
+    with database.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            cursor.executemany(
+                "INSERT INTO categories (id, name, description, parent_id) VALUES (?, ?, ?, ?)",
+                chunk
+            )
+        database.rebuild_tree_stats(cursor)
+        cursor.execute("ANALYZE")
+        conn.commit()
+    database.close_connections()
+    for suffix in ('-wal', '-shm'):
+        Path(str(partial) + suffix).unlink(missing_ok=True)
+    partial.rename(path)
+
+    database.configure(path=path)
+    tree_index.invalidate()
+    return path
+
+
+def sample_ids(size: int, count: int, seed: int = 0) -> List[int]:
+    rng = random.Random(seed + 1)
+    return [rng.randint(1, size) for _ in range(count)]
+
+
+def name_of(category_id: int) -> str:
+    index = category_id - 1
+    return f"{WORDS[index % len(WORDS)]}-{index}"
@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import sys
+
+# Модули db, models и utils импортируются внутри команд: запуск без Qt и без лишних импортов
+
+
+def _open_db(path, in_memory=False):
+    from db import database
+    if path or in_memory:
+        database.configure(path=path, in_memory=in_memory)
+    database.init_db()
+
+
+def _print_json(data):
+    json.dump(data, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+
+
+def _report_progress(label):
+    def report(count):
+        sys.stderr.write(f"\r{label}: {count}")
+        sys.stderr.flush()
+    return report
+
+
+def cmd_export(args):
+    from utils.tree_export import export_tree, write_tree
+    progress = _report_progress("Экспортировано узлов") if args.progress else None
+    if args.output == '-':
+        stats = write_tree(args.category_id, sys.stdout, args.format or 'text', progress)
+    else:
+        stats = export_tree(args.category_id, args.output, args.format, progress)
+    if progress:
+        sys.stderr.write("\n")
+    if args.output != '-':
+        sys.stderr.write(f"Узлов: {stats['node_count']}, глубина: {stats['depth']}\n")
+    return 0
+
+
+def cmd_import(args):
+    from utils.tree_import import import_tree
+    progress = _report_progress("Импортировано узлов") if args.progress else None
+    imported = import_tree(args.file, args.format, args.parent_id, progress=progress)
+    if progress:
+        sys.stderr.write("\n")
+    print(imported)
+    return 0
+
+
+def cmd_stats(args):
+    if args.histograms or args.category_id is None:
+        from utils.tree_snapshot import TreeSnapshot
+        snapshot = TreeSnapshot.load(args.category_id)
+        if not len(snapshot) and args.category_id is not None:
+            sys.stderr.write(f"Категория {args.category_id} не найдена\n")
+            return 1
+        stats = snapshot.statistics(args.category_id)
+        if args.category_id is None:
+            stats['roots'] = snapshot.parents.count(-1)
+        stats['fanout'] = snapshot.fanout_histogram(args.category_id)
+        stats['depths'] = snapshot.depth_histogram(args.category_id)
+    else:
+        from models.category import Category
+        from utils.tree_utils import get_tree_statistics
+        if Category.get_by_id(args.category_id) is None:
+            sys.stderr.write(f"Категория {args.category_id} не найдена\n")
+            return 1
+        stats = get_tree_statistics(args.category_id)
+    _print_json(stats)
+    return 0
+
+
+def cmd_search(args):
+    from utils.search import search_categories
+    results = search_categories(args.query, limit=args.limit, offset=args.offset)
+    if args.json:
+        _print_json(results)
+        return 0
+    for result in results:
+        path = " / ".join(entry['name'] for entry in result['path'] + [result])
+        print(f"{result['id']}\t{path}")
+    return 0
+
+
+def cmd_tree(args):
+    from utils.tree_export import iter_subtree
+    from utils.tree_traversal import PrintVisitor, run
+    rows = iter_subtree(args.category_id)
+    if args.max_depth is not None:
+        rows = (row for row in rows if row[4] < args.max_depth)
+    run(rows, [PrintVisitor(file=sys.stdout)])
+    return 0
+
+
+def cmd_path(args):
+    from models.path_cache import path_cache
+    path = path_cache.get_paths([args.category_id]).get(args.category_id)
+    if path is None:
+        sys.stderr.write(f"Категория {args.category_id} не найдена\n")
+        return 1
+    if args.json:
+        _print_json([{'id': entry.id, 'name': entry.name} for entry in path])
+    else:
+        print(" / ".join(entry.name for entry in path))
+    return 0
+
+
+def cmd_changes(args):
+    from utils.tree_export import write_changes
+    progress = _report_progress("Выгружено изменений") if args.progress else None
+    if args.output == '-':
+        revision = write_changes(args.since, sys.stdout, progress)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            revision = write_changes(args.since, file, progress)
+    if progress:
+        sys.stderr.write("\n")
+    sys.stderr.write(f"Ревизия: {revision}\n")
+    return 0
+
+
+def cmd_compact(args):
+    from models import change_log
+    print(change_log.compact(args.before))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Учет знаний без графического интерфейса")
+    parser.add_argument('--db', help="Путь к файлу базы (по умолчанию data/knowledge.db)")
+    parser.add_argument('--in-memory', action='store_true', help="Загрузить базу в память; изменения записываются на диск при выходе")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="Экспорт поддерева")
+    export.add_argument('category_id', type=int)
+    export.add_argument('output', help="Файл или '-' для stdout")
+    export.add_argument('--format', choices=['text', 'markdown', 'jsonl', 'opml', 'dot'])
+    export.add_argument('--progress', action='store_true')
+    export.set_defaults(handler=cmd_export)
+
+    imports = commands.add_parser('import', help="Импорт дерева из JSON, текста или CSV")
+    imports.add_argument('file')
+    imports.add_argument('--format', choices=['json', 'text', 'csv'])
+    imports.add_argument('--parent-id', type=int)
+    imports.add_argument('--progress', action='store_true')
+    imports.set_defaults(handler=cmd_import)
+
+    stats = commands.add_parser('stats', help="Статистика поддерева или всего дерева")
+    stats.add_argument('category_id', type=int, nargs='?')
+    stats.add_argument('--histograms', action='store_true', help="Гистограммы ветвления и глубин")
+    stats.set_defaults(handler=cmd_stats)
+
+    search = commands.add_parser('search', help="Полнотекстовый поиск")
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=20)
+    search.add_argument('--offset', type=int, default=0)
+    search.add_argument('--json', action='store_true')
+    search.set_defaults(handler=cmd_search)
+
+    tree = commands.add_parser('tree', help="Вывод дерева в консоль")
+    tree.add_argument('category_id', type=int, nargs='?')
+    tree.add_argument('--max-depth', type=int)
+    tree.set_defaults(handler=cmd_tree)
+
+    path = commands.add_parser('path', help="Путь от корня до категории")
+    path.add_argument('category_id', type=int)
+    path.add_argument('--json', action='store_true')
+    path.set_defaults(handler=cmd_path)
+
+    changes = commands.add_parser('changes', help="Изменения после ревизии в JSON Lines")
+    changes.add_argument('--since', type=int, default=0, help="Последняя уже полученная ревизия")
+    changes.add_argument('--output', default='-', help="Файл или '-' для stdout")
+    changes.add_argument('--progress', action='store_true')
+    changes.set_defaults(handler=cmd_changes)
+
+    compact = commands.add_parser('compact-changes', help="Сжатие журнала изменений до ревизии")
+    compact.add_argument('before', type=int)
+    compact.set_defaults(handler=cmd_compact)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    _open_db(args.db, args.in_memory)
+    try:
+        return args.handler(args)
+    except BrokenPipeError:
+        # Вывод оборван (например, | head): остаток отбрасываем без трассировки
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    except (ValueError, OSError) as e:
+        sys.stderr.write(f"Ошибка: {e}\n")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
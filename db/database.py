@@ -1,11 +1,756 @@
+import atexit
+import functools
+import itertools
+import json
+import os
+import queue
 import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import closing
 from pathlib import Path
 
 DB_PATH = Path(__file__).parent.parent / "data" / "knowledge.db"
 
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+POOL_SIZE = 8
+# Модель использует пару десятков разных запросов, запас на рекурсивные CTE
+CACHED_STATEMENTS = 64
+
+SLOW_STATEMENT_SECONDS = 0.1
+# Обработчик прогресса вызывается раз в столько инструкций виртуальной машины sqlite
+PROGRESS_INSTRUCTIONS = 10000
+SLOW_LOG_SIZE = 200
+UNSCOPED_OPERATION = '(unscoped)'
+
+# Как часто копия базы в памяти сбрасывается на диск, если в ней есть изменения
+MEMORY_FLUSH_SECONDS = 30.0
+
+
+class _Frame:
+    __slots__ = ('name', 'started', 'statements', 'trigger_statements', 'rows_changed', 'instructions')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.trigger_statements = 0
+        self.rows_changed = 0
+        self.instructions = 0
+
+
+class Instrumentation:
+    # Хуки ставятся на соединения только при включении: в выключенном состоянии sqlite их не вызывает
+    def __init__(self):
+        self.enabled = False
+        self.slow_threshold = SLOW_STATEMENT_SECONDS
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._operations = {}
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+
+    def _state(self):
+        state = self._local
+        if not hasattr(state, 'frames'):
+            state.frames = [_Frame(UNSCOPED_OPERATION)]
+            state.conn = None
+            state.sql = None
+            state.started = 0.0
+            state.active = 0.0
+            state.changes = 0
+            state.slow_entry = None
+        return state
+
+    def install(self, conn):
+        conn.set_trace_callback(lambda sql: self._on_statement(conn, sql))
+        conn.set_progress_handler(self._on_progress, PROGRESS_INSTRUCTIONS)
+
+    @staticmethod
+    def uninstall(conn):
+        conn.set_trace_callback(None)
+        conn.set_progress_handler(None, PROGRESS_INSTRUCTIONS)
+
+    def _log_slow(self, state, elapsed):
+        if state.slow_entry is None:
+            state.slow_entry = {
+                'sql': state.sql,
+                'operation': state.frames[-1].name,
+                'thread': threading.current_thread().name,
+                'seconds': elapsed,
+            }
+            with self._lock:
+                self._slow.append(state.slow_entry)
+        else:
+            state.slow_entry['seconds'] = elapsed
+
+    def _finish_statement(self, state):
+        if state.sql is None:
+            return
+        # Конец оператора sqlite не сообщает: время считается до последней замеченной активности
+        # (тик прогресса или оператор триггера), а не до следующего события — паузы между запросами не в счёт
+        elapsed = state.active - state.started
+        try:
+            state.frames[-1].rows_changed += state.conn.total_changes - state.changes
+        except sqlite3.ProgrammingError:
+            # Соединение уже закрыто
+            pass
+        if state.slow_entry is not None or elapsed >= self.slow_threshold:
+            self._log_slow(state, elapsed)
+        if len(state.frames) == 1:
+            # Запрос вне операций учитывается сразу как отдельный вызов
+            self._record(state.frames[0], elapsed)
+            state.frames[0] = _Frame(UNSCOPED_OPERATION)
+        state.sql = None
+        state.slow_entry = None
+
+    def _on_statement(self, conn, sql):
+        state = self._state()
+        # Операторы внутри триггеров приходят как комментарии "-- TRIGGER ..."
+        if sql.startswith('--'):
+            state.frames[-1].trigger_statements += 1
+            if state.sql is not None:
+                state.active = time.perf_counter()
+            return
+        self._finish_statement(state)
+        # Кадр берётся после завершения предыдущего оператора: вне операций он заменяется новым
+        state.frames[-1].statements += 1
+        state.conn = conn
+        state.sql = sql
+        state.started = state.active = time.perf_counter()
+        state.changes = conn.total_changes
+
+    def _on_progress(self):
+        state = self._state()
+        state.frames[-1].instructions += PROGRESS_INSTRUCTIONS
+        if state.sql is None:
+            return 0
+        state.active = time.perf_counter()
+        # Долгий запрос попадает в журнал ещё до завершения
+        elapsed = state.active - state.started
+        if elapsed >= self.slow_threshold:
+            self._log_slow(state, elapsed)
+        return 0
+
+    def _record(self, frame, elapsed):
+        with self._lock:
+            totals = self._operations.setdefault(frame.name, {
+                'calls': 0, 'statements': 0, 'trigger_statements': 0,
+                'rows_changed': 0, 'instructions': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+            })
+            totals['calls'] += 1
+            totals['statements'] += frame.statements
+            totals['trigger_statements'] += frame.trigger_statements
+            totals['rows_changed'] += frame.rows_changed
+            totals['instructions'] += frame.instructions
+            totals['seconds'] += elapsed
+            totals['max_seconds'] = max(totals['max_seconds'], elapsed)
+
+    def begin(self, name):
+        state = self._state()
+        self._finish_statement(state)
+        state.frames.append(_Frame(name))
+
+    def end(self):
+        state = self._state()
+        if len(state.frames) < 2:
+            return
+        self._finish_statement(state)
+        frame = state.frames.pop()
+        self._record(frame, time.perf_counter() - frame.started)
+        if len(state.frames) == 1:
+            return
+        # Счётчики вложенной операции входят и во внешнюю
+        outer = state.frames[-1]
+        outer.statements += frame.statements
+        outer.trigger_statements += frame.trigger_statements
+        outer.rows_changed += frame.rows_changed
+        outer.instructions += frame.instructions
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._slow.clear()
+
+    def snapshot(self):
+        self._finish_statement(self._state())
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'slow_threshold': self.slow_threshold,
+                'operations': {name: dict(totals) for name, totals in self._operations.items()},
+                'slow_statements': [dict(entry) for entry in self._slow],
+            }
+
+
+class operation:
+    # Контекстный менеджер и декоратор: счётчики SQL собираются под именем операции
+    def __init__(self, name=None):
+        self.name = name
+
+    def __enter__(self):
+        if instrumentation.enabled:
+            instrumentation.begin(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        if instrumentation.enabled:
+            instrumentation.end()
+        return False
+
+    def __call__(self, fn):
+        name = self.name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return fn(*args, **kwargs)
+            instrumentation.begin(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                instrumentation.end()
+        return wrapper
+
+
+instrumentation = Instrumentation()
+
+
+class ConnectionManager:
+    def __init__(self, path, pragmas=None, pool_size=POOL_SIZE, cached_statements=CACHED_STATEMENTS, uri=False):
+        self.path = path
+        self.uri = uri
+        self.pragmas = dict(PRAGMAS if pragmas is None else pragmas)
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            uri=self.uri,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if instrumentation.enabled:
+            instrumentation.install(conn)
+        return conn
+
+    def connections(self):
+        with self._lock:
+            return list(self._owners)
+
+    def _reclaim_orphaned(self):
+        # Соединения завершившихся потоков возвращаем в пул
+        with self._lock:
+            dead = [conn for conn, owner in self._owners.items()
+                    if owner is not None and not owner.is_alive()]
+            for conn in dead:
+                self._owners[conn] = None
+        for conn in dead:
+            self._put_idle(conn)
+
+    def _put_idle(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            with self._lock:
+                self._owners.pop(conn, None)
+            conn.close()
+
+    def connection(self):
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            return conn
+
+        self._reclaim_orphaned()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        with self._lock:
+            self._owners[conn] = threading.current_thread()
+        self._local.connection = conn
+        return conn
+
+    def release(self):
+        conn = self._local.__dict__.pop('connection', None)
+        if conn is not None:
+            with self._lock:
+                self._owners[conn] = None
+            self._put_idle(conn)
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._owners)
+            self._owners.clear()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class MemoryMirror:
+    # Копия базы в памяти (VFS memdb, общая для всех соединений процесса).
+    # Фоновый поток по PRAGMA data_version замечает коммиты и копирует базу на диск backup API
+    _names = itertools.count()
+
+    def __init__(self, path, flush_interval=MEMORY_FLUSH_SECONDS):
+        self.path = path
+        self.uri = f"file:/knowledge-{os.getpid()}-{next(self._names)}?vfs=memdb"
+        self.flush_interval = flush_interval
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Держит базу в памяти живой, пока открыт, и через него же идёт сброс на диск
+        self._holder = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        if Path(path).exists():
+            # backup() перенёс бы заголовок WAL, который memdb открыть не может; VACUUM INTO пишет обычный формат
+            with closing(sqlite3.connect(Path(path).resolve().as_uri(), uri=True)) as disk:
+                disk.execute("VACUUM INTO ?", (self.uri,))
+        self._version = self._data_version()
+        self._thread = threading.Thread(target=self._run, name='memory-flush', daemon=True)
+        self._thread.start()
+
+    def _data_version(self):
+        return self._holder.execute("PRAGMA data_version").fetchone()[0]
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def flush(self, force=False):
+        with self._lock:
+            version = self._data_version()
+            if version == self._version and not force:
+                return False
+            Path(self.path).parent.mkdir(exist_ok=True)
+            with closing(sqlite3.connect(self.path)) as disk:
+                self._holder.backup(disk)
+            self._version = version
+            self.flushes += 1
+            return True
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.flush()
+        finally:
+            self._holder.close()
+
+
+_manager = None
+_mirror = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ConnectionManager(DB_PATH)
+    return _manager
+
+
+def configure(path=None, pragmas=None, pool_size=POOL_SIZE, cached_statements=CACHED_STATEMENTS,
+              in_memory=False, flush_interval=MEMORY_FLUSH_SECONDS):
+    # in_memory: запросы идут к копии базы в памяти, файл на диске обновляется фоном и при закрытии
+    global DB_PATH, _manager, _mirror
+    with _manager_lock:
+        _close_locked()
+        if path is not None:
+            DB_PATH = path
+        if in_memory:
+            _mirror = MemoryMirror(DB_PATH, flush_interval)
+            _manager = ConnectionManager(_mirror.uri, pragmas, pool_size, cached_statements, uri=True)
+        else:
+            _manager = ConnectionManager(DB_PATH, pragmas, pool_size, cached_statements)
+    return _manager
+
+
+def _close_locked():
+    global _manager, _mirror
+    if _manager is not None:
+        _manager.close_all()
+    if _mirror is not None:
+        # Без копии в памяти менеджер снова откроется на файле
+        _mirror.close()
+        _mirror = None
+        _manager = None
+
+
+def flush_memory():
+    # Немедленный сброс копии в памяти на диск; без режима in_memory ничего не делает
+    mirror = _mirror
+    return mirror.flush() if mirror is not None else False
+
+
+def _add_parent_name_index(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_categories_parent_name ON categories (parent_id, name)")
+
+
+def _drop_name_nocase_index(cursor):
+    # Индекс по name COLLATE NOCASE ни один запрос не использовал: имена ищутся через TreeIndex и FTS,
+    # а NOCASE не сворачивает кириллицу. Шаг стоит на месте прежнего, чтобы номера миграций не сдвинулись,
+    # и повторяется в конце для баз, где индекс уже создан
+    cursor.execute("DROP INDEX IF EXISTS idx_categories_name_nocase")
+
+
+def _add_parent_id_index(cursor):
+    # Записи индекса упорядочены по (parent_id, rowid): сортировка детей по id идёт без временного B-дерева
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_categories_parent_id ON categories (parent_id)")
+
+
+def _analyze(cursor):
+    cursor.execute("ANALYZE")
+
+
+def rebuild_closure(cursor):
+    cursor.execute("DELETE FROM category_closure")
+    cursor.execute("""
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE closure(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM categories
+            UNION ALL
+            SELECT parent.id, closure.descendant_id, closure.depth + 1
+            FROM closure
+            JOIN categories child ON child.id = closure.ancestor_id
+            JOIN categories parent ON parent.id = child.parent_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM closure
+    """)
+
+
+def compute_tree_stats(cursor, root_id=None):
+    if root_id is None:
+        cursor.execute("SELECT id, parent_id FROM categories")
+    else:
+        cursor.execute("""
+            SELECT c.id, c.parent_id
+            FROM category_closure cl
+            JOIN categories c ON c.id = cl.descendant_id
+            WHERE cl.ancestor_id = ?
+        """, (root_id,))
+    rows = cursor.fetchall()
+    existing = {category_id for category_id, _ in rows}
+    children = {}
+    for category_id, parent_id in rows:
+        children.setdefault(parent_id if parent_id in existing else None, []).append(category_id)
+
+    # (child_count, node_count, height, leaf_count, branch_count), обход в обратном порядке без рекурсии
+    stats = {}
+    stack = list(children.get(None, ()))
+    order = []
+    while stack:
+        current = stack.pop()
+        order.append(current)
+        stack.extend(children.get(current, ()))
+
+    for current in reversed(order):
+        child_ids = children.get(current, ())
+        node_count, height, leaf_count, branch_count = 1, 1, 0, 0
+        for child_id in child_ids:
+            _, child_nodes, child_height, child_leaves, child_branches = stats[child_id]
+            node_count += child_nodes
+            height = max(height, child_height + 1)
+            leaf_count += child_leaves
+            branch_count += child_branches
+        if not child_ids:
+            leaf_count = 1
+        elif len(child_ids) > 1:
+            branch_count += 1
+        stats[current] = (len(child_ids), node_count, height, leaf_count, branch_count)
+    return stats
+
+
+def rebuild_tree_stats(cursor):
+    stats = compute_tree_stats(cursor)
+    cursor.execute("DELETE FROM category_stats")
+    cursor.executemany("""
+        INSERT INTO category_stats (category_id, child_count, node_count, height, leaf_count, branch_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, ((category_id, *values) for category_id, values in stats.items()))
+
+
+def _add_tree_stats_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS category_stats (
+        category_id INTEGER PRIMARY KEY,
+        child_count INTEGER NOT NULL DEFAULT 0,
+        node_count INTEGER NOT NULL DEFAULT 1,
+        height INTEGER NOT NULL DEFAULT 1,
+        leaf_count INTEGER NOT NULL DEFAULT 1,
+        branch_count INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    rebuild_tree_stats(cursor)
+
+
+def has_fts(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'categories_fts'"
+    ).fetchone()
+    return row is not None
+
+
+def _add_fulltext_index(cursor):
+    try:
+        cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS categories_fts USING fts5(
+            name,
+            description,
+            content = 'categories',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """)
+    except sqlite3.OperationalError:
+        # Сборка sqlite без FTS5: поиск работает через LIKE
+        return
+
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_fts_insert
+    AFTER INSERT ON categories
+    BEGIN
+        INSERT INTO categories_fts (rowid, name, description)
+        VALUES (NEW.id, NEW.name, NEW.description);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_fts_delete
+    AFTER DELETE ON categories
+    BEGIN
+        INSERT INTO categories_fts (categories_fts, rowid, name, description)
+        VALUES ('delete', OLD.id, OLD.name, OLD.description);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_fts_update
+    AFTER UPDATE OF name, description ON categories
+    BEGIN
+        INSERT INTO categories_fts (categories_fts, rowid, name, description)
+        VALUES ('delete', OLD.id, OLD.name, OLD.description);
+        INSERT INTO categories_fts (rowid, name, description)
+        VALUES (NEW.id, NEW.name, NEW.description);
+    END
+    """)
+    cursor.execute("INSERT INTO categories_fts (categories_fts) VALUES ('rebuild')")
+
+
+def _add_closure_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS category_closure (
+        ancestor_id INTEGER NOT NULL,
+        descendant_id INTEGER NOT NULL,
+        depth INTEGER NOT NULL,
+        PRIMARY KEY (ancestor_id, descendant_id)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_category_closure_descendant
+    ON category_closure (descendant_id, depth)
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_closure_insert
+    AFTER INSERT ON categories
+    BEGIN
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        VALUES (NEW.id, NEW.id, 0);
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, NEW.id, depth + 1
+        FROM category_closure
+        WHERE descendant_id = NEW.parent_id;
+    END
+    """)
+    # Поддерево удалённого узла отрывается от всех его предков
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_closure_delete
+    AFTER DELETE ON categories
+    BEGIN
+        DELETE FROM category_closure
+        WHERE descendant_id IN (SELECT descendant_id FROM category_closure WHERE ancestor_id = OLD.id)
+          AND ancestor_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = OLD.id);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_closure_move
+    AFTER UPDATE OF parent_id ON categories
+    WHEN OLD.parent_id IS NOT NEW.parent_id
+    BEGIN
+        DELETE FROM category_closure
+        WHERE descendant_id IN (SELECT descendant_id FROM category_closure WHERE ancestor_id = NEW.id)
+          AND ancestor_id IN (SELECT ancestor_id FROM category_closure
+                              WHERE descendant_id = NEW.id AND ancestor_id != NEW.id);
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+        FROM category_closure above
+        JOIN category_closure below
+        WHERE above.descendant_id = NEW.parent_id
+          AND below.ancestor_id = NEW.id;
+    END
+    """)
+    rebuild_closure(cursor)
+
+
+def _purge_orphans(cursor):
+    # Старый Category.delete удалял один уровень: внуки оставались со ссылкой на удалённого родителя
+    cursor.execute("""
+    WITH RECURSIVE orphans(id, depth) AS (
+        SELECT c.id, 0
+        FROM categories c
+        WHERE c.parent_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM categories p WHERE p.id = c.parent_id)
+        UNION ALL
+        SELECT c.id, o.depth + 1
+        FROM categories c
+        JOIN orphans o ON c.parent_id = o.id
+    )
+    SELECT id FROM orphans ORDER BY depth DESC
+    """)
+    ids = [(row[0],) for row in cursor.fetchall()]
+    cursor.executemany("DELETE FROM category_closure WHERE descendant_id = ?", ids)
+    cursor.executemany("DELETE FROM category_stats WHERE category_id = ?", ids)
+    cursor.executemany("DELETE FROM categories WHERE id = ?", ids)
+
+
+def _add_change_log(cursor):
+    # Журнал изменений для инкрементальной синхронизации: каждая строка — полное состояние категории
+    # после записи, revision с AUTOINCREMENT не переиспользуется и после компактации
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS category_changes (
+        revision INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        name TEXT,
+        description TEXT,
+        parent_id INTEGER,
+        changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_category_changes_category
+    ON category_changes (category_id, revision)
+    """)
+    # Виды совпадают с константами models.events
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_changes_insert
+    AFTER INSERT ON categories
+    BEGIN
+        INSERT INTO category_changes (category_id, kind, name, description, parent_id)
+        VALUES (NEW.id, 'created', NEW.name, NEW.description, NEW.parent_id);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_changes_update
+    AFTER UPDATE OF name, description ON categories
+    WHEN OLD.name IS NOT NEW.name OR OLD.description IS NOT NEW.description
+    BEGIN
+        INSERT INTO category_changes (category_id, kind, name, description, parent_id)
+        VALUES (NEW.id, 'updated', NEW.name, NEW.description, NEW.parent_id);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_changes_move
+    AFTER UPDATE OF parent_id ON categories
+    WHEN OLD.parent_id IS NOT NEW.parent_id
+    BEGIN
+        INSERT INTO category_changes (category_id, kind, name, description, parent_id)
+        VALUES (NEW.id, 'moved', NEW.name, NEW.description, NEW.parent_id);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_changes_delete
+    AFTER DELETE ON categories
+    BEGIN
+        INSERT INTO category_changes (category_id, kind, name, description, parent_id)
+        VALUES (OLD.id, 'deleted', OLD.name, OLD.description, OLD.parent_id);
+    END
+    """)
+    # Уже существующее дерево попадает в журнал одной пачкой: родители раньше детей
+    cursor.execute("""
+    INSERT INTO category_changes (category_id, kind, name, description, parent_id)
+    SELECT c.id, 'created', c.name, c.description, c.parent_id
+    FROM categories c
+    JOIN category_closure cl ON cl.descendant_id = c.id
+    GROUP BY c.id
+    ORDER BY MAX(cl.depth), c.id
+    """)
+
+
+def _add_change_log_compaction(cursor):
+    # Граница сжатия журнала: до неё на категорию остаётся одна запись и порядок ревизий не родители-первыми
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS category_changes_compaction (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        revision INTEGER NOT NULL
+    )
+    """)
+
+
+# Порядок важен: номер миграции = позиция в списке, хранится в PRAGMA user_version
+MIGRATIONS = [
+    _add_parent_name_index,
+    _drop_name_nocase_index,
+    _analyze,
+    _add_closure_table,
+    _analyze,
+    _add_tree_stats_table,
+    _add_fulltext_index,
+    _purge_orphans,
+    _add_parent_id_index,
+    _analyze,
+    _add_change_log,
+    _add_change_log_compaction,
+    _drop_name_nocase_index,
+]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    while get_schema_version(conn) < len(MIGRATIONS):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = get_schema_version(conn)
+            if version < len(MIGRATIONS):
+                MIGRATIONS[version](conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
 def init_db():
     Path(DB_PATH).parent.mkdir(exist_ok=True)
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
         CREATE TABLE IF NOT EXISTS categories (
@@ -17,6 +762,155 @@ def init_db():
         )
         """)
         conn.commit()
+        migrate(conn)
+
+
+class SessionConnection:
+    # Соединение внутри сессии: commit и выход из with не завершают общую транзакцию
+    __slots__ = ('_conn',)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        raise sqlite3.ProgrammingError("Cannot roll back inside a session; raise an exception instead")
+
+
+class _SessionLevel:
+    def __init__(self, savepoint):
+        self.savepoint = savepoint
+        self.after_commit = []
+        self.on_rollback = []
+
+
+_sessions = threading.local()
+
+
+def _session_stack():
+    stack = getattr(_sessions, 'stack', None)
+    if stack is None:
+        stack = _sessions.stack = []
+    return stack
+
+
+class session:
+    # Единица работы: записи внутри идут одной транзакцией потока, вложенные сессии — точки сохранения.
+    # Ошибка откатывает только свой уровень; действия after_commit выполняются после внешнего коммита
+    def __enter__(self):
+        stack = _session_stack()
+        conn = get_manager().connection()
+        if stack:
+            savepoint = f"session_{len(stack)}"
+            conn.execute(f"SAVEPOINT {savepoint}")
+        else:
+            savepoint = None
+            conn.execute("BEGIN IMMEDIATE")
+        stack.append(_SessionLevel(savepoint))
+        return SessionConnection(conn)
+
+    def __exit__(self, exc_type, exc, tb):
+        stack = _session_stack()
+        level = stack[-1]
+        conn = get_manager().connection()
+        if exc_type is None:
+            try:
+                if level.savepoint:
+                    conn.execute(f"RELEASE {level.savepoint}")
+                else:
+                    conn.commit()
+            except BaseException:
+                self._rollback(conn, stack)
+                raise
+            stack.pop()
+            if stack:
+                stack[-1].after_commit.extend(level.after_commit)
+                stack[-1].on_rollback.extend(
+                    callback for callback in level.on_rollback if callback not in stack[-1].on_rollback)
+            else:
+                for callback in level.after_commit:
+                    callback()
+        else:
+            self._rollback(conn, stack)
+        return False
+
+    @staticmethod
+    def _rollback(conn, stack):
+        level = stack.pop()
+        if level.savepoint:
+            conn.execute(f"ROLLBACK TO {level.savepoint}")
+            conn.execute(f"RELEASE {level.savepoint}")
+        else:
+            conn.rollback()
+        for callback in level.on_rollback:
+            callback()
+
+
+def in_session():
+    return bool(getattr(_sessions, 'stack', None))
+
+
+def after_commit(callback):
+    # Вне сессии вызывается сразу: запись уже зафиксирована
+    stack = getattr(_sessions, 'stack', None)
+    if stack:
+        stack[-1].after_commit.append(callback)
+    else:
+        callback()
+
+
+def on_rollback(callback):
+    stack = getattr(_sessions, 'stack', None)
+    if stack and callback not in stack[-1].on_rollback:
+        stack[-1].on_rollback.append(callback)
+
 
 def get_connection():
-    return sqlite3.connect(DB_PATH)
\ No newline at end of file
+    conn = get_manager().connection()
+    return SessionConnection(conn) if in_session() else conn
+
+
+def release_connection():
+    if _manager is not None:
+        _manager.release()
+
+
+def close_connections():
+    with _manager_lock:
+        _close_locked()
+
+
+def enable_instrumentation(slow_threshold=SLOW_STATEMENT_SECONDS):
+    instrumentation.slow_threshold = slow_threshold
+    instrumentation.enabled = True
+    for conn in get_manager().connections():
+        instrumentation.install(conn)
+
+
+def disable_instrumentation():
+    instrumentation.enabled = False
+    if _manager is not None:
+        for conn in _manager.connections():
+            instrumentation.uninstall(conn)
+
+
+def instrumentation_snapshot():
+    return instrumentation.snapshot()
+
+
+def dump_instrumentation(file=None):
+    json.dump(instrumentation.snapshot(), file or sys.stderr, ensure_ascii=False, indent=2)
+
+
+atexit.register(close_connections)
@@ -1,12 +1,23 @@
+import os
 import sys
 from PyQt6.QtWidgets import QApplication
-from db.database import init_db
+from db.database import init_db, close_connections, configure, enable_instrumentation, SLOW_STATEMENT_SECONDS
 from ui.main_window import MainWindow
 
 
 def main():
+    # KNOWLEDGE_SQL_PROFILE=1 включает сбор статистики SQL, порог медленных запросов — KNOWLEDGE_SQL_SLOW_MS
+    if os.environ.get("KNOWLEDGE_SQL_PROFILE"):
+        slow_ms = os.environ.get("KNOWLEDGE_SQL_SLOW_MS")
+        enable_instrumentation(float(slow_ms) / 1000 if slow_ms else SLOW_STATEMENT_SECONDS)
+
+    # KNOWLEDGE_IN_MEMORY=1 — работа с копией базы в памяти, сброс на диск фоном и при выходе
+    if os.environ.get("KNOWLEDGE_IN_MEMORY"):
+        configure(in_memory=True)
+
     init_db()
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(close_connections)
 
     window = MainWindow()
     window.show()
@@ -1,7 +1,22 @@
-from db.database import get_connection
+from functools import partial
+
+from db.database import after_commit, get_connection, session
+from models import change_log, events, tree_stats
+from models.tree_index import tree_index
+
+# Старые сборки sqlite ограничивают число параметров запроса 999
+MAX_QUERY_PARAMS = 900
+
+# Столбцы ключа сортировки детей; id в конце делает ключ уникальным
+CHILD_SORTS = {
+    'name': ('name', 'id'),
+    'id': ('id',),
+}
 
 
 class Category:
+    __slots__ = ('id', 'name', 'description', 'parent_id')
+
     def __init__(self, id=None, name="", description="", parent_id=None):
         self.id = id
         self.name = name
@@ -10,14 +25,18 @@ class Category:
 
     @staticmethod
     def create(name, description, parent_id=None):
-        with get_connection() as conn:
+        with session() as conn, change_log.own_changes():
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO categories (name, description, parent_id) VALUES (?, ?, ?)",
                 (name, description, parent_id)
             )
-            conn.commit()
-            return cursor.lastrowid
+            category_id = cursor.lastrowid
+            tree_stats.attach(cursor, category_id, parent_id)
+            tree_index.stage('on_created', (category_id, name, description, parent_id))
+            after_commit(partial(events.publish, events.CREATED, category_id,
+                                 name=name, description=description, parent_id=parent_id))
+        return category_id
 
     @staticmethod
     def get_by_id(category_id):
@@ -30,45 +49,274 @@ class Category:
             return None
 
     @staticmethod
-    def update(category_id, name, description):
+    def get_by_ids(category_ids):
+        # Один запрос на пачку id; отсутствующих id в результате нет
+        ids = list(dict.fromkeys(category_ids))
+        result = {}
         with get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), MAX_QUERY_PARAMS):
+                chunk = ids[start:start + MAX_QUERY_PARAMS]
+                cursor.execute(
+                    f"SELECT id, name, description, parent_id FROM categories WHERE id IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    result[row[0]] = Category(*row)
+        return result
+
+    @staticmethod
+    def update(category_id, name, description):
+        with session() as conn, change_log.own_changes():
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE categories SET name = ?, description = ? WHERE id = ?",
                 (name, description, category_id)
             )
-            conn.commit()
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+            if updated:
+                cursor.execute("SELECT parent_id FROM categories WHERE id = ?", (category_id,))
+                parent_id = cursor.fetchone()[0]
+                tree_index.stage('on_updated', category_id, name, description)
+                after_commit(partial(events.publish, events.UPDATED, category_id,
+                                     name=name, description=description, parent_id=parent_id))
+        return updated
 
     @staticmethod
-    def delete(category_id):
-        with get_connection() as conn:
+    def move(category_id, new_parent_id):
+        return Category.move_many([category_id], new_parent_id) > 0
+
+    @staticmethod
+    def move_many(category_ids, new_parent_id):
+        # Все переносы — одна транзакция; closure переписывает триггер, агрегаты правятся detach/attach
+        ids = list(dict.fromkeys(category_ids))
+        moved = 0
+        with session() as conn, change_log.own_changes():
+            cursor = conn.cursor()
+            if new_parent_id is not None:
+                # Все предки нового родителя одним запросом вместо is_ancestor для каждого узла
+                cursor.execute("SELECT ancestor_id FROM category_closure WHERE descendant_id = ?", (new_parent_id,))
+                ancestors = {row[0] for row in cursor.fetchall()}
+                if not ancestors:
+                    raise ValueError(f"Category {new_parent_id} not found")
+                cycle = ancestors.intersection(ids)
+                if cycle:
+                    raise ValueError(f"Cannot move category {min(cycle)} into its own subtree")
+
+            # Потомок переносимого узла переезжает вместе с ним: отдельный перенос оторвал бы его от предка
+            nested = set()
+            for start in range(0, len(ids), MAX_QUERY_PARAMS // 2):
+                chunk = ids[start:start + MAX_QUERY_PARAMS // 2]
+                for other in range(0, len(ids), MAX_QUERY_PARAMS // 2):
+                    others = ids[other:other + MAX_QUERY_PARAMS // 2]
+                    cursor.execute(f"""
+                        SELECT descendant_id FROM category_closure
+                        WHERE depth > 0
+                          AND descendant_id IN ({', '.join('?' * len(chunk))})
+                          AND ancestor_id IN ({', '.join('?' * len(others))})
+                    """, (*chunk, *others))
+                    nested.update(row[0] for row in cursor.fetchall())
+
+            for category_id in ids:
+                if category_id in nested:
+                    continue
+                cursor.execute("SELECT name, description, parent_id FROM categories WHERE id = ?", (category_id,))
+                row = cursor.fetchone()
+                if row is None or row[2] == new_parent_id:
+                    continue
+                name, description, old_parent_id = row
+                tree_stats.detach(cursor, category_id)
+                cursor.execute("UPDATE categories SET parent_id = ? WHERE id = ?", (new_parent_id, category_id))
+                tree_stats.refresh_heights(cursor, old_parent_id)
+                tree_stats.attach(cursor, category_id, new_parent_id)
+                tree_index.stage('on_moved', category_id, new_parent_id)
+                after_commit(partial(events.publish, events.MOVED, category_id, name=name, description=description,
+                                     parent_id=new_parent_id, old_parent_id=old_parent_id))
+                moved += 1
+        return moved
+
+    @staticmethod
+    def _subtree_ids(cursor, category_id):
+        # Самые глубокие узлы первыми: потомки удаляются раньше родителей
+        cursor.execute("""
+            WITH RECURSIVE subtree(id, depth) AS (
+                SELECT id, 0 FROM categories WHERE id = ?
+                UNION ALL
+                SELECT c.id, s.depth + 1
+                FROM categories c
+                JOIN subtree s ON c.parent_id = s.id
+            )
+            SELECT id FROM subtree ORDER BY depth DESC
+        """, (category_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def _delete_rows(cursor, category_ids):
+        if not category_ids:
+            return 0
+        params = [(category_id,) for category_id in category_ids]
+        # Строки closure убираются заранее, чтобы триггер удаления не перебирал поддерево для каждой строки
+        cursor.executemany("DELETE FROM category_closure WHERE descendant_id = ?", params)
+        cursor.executemany("DELETE FROM categories WHERE id = ?", params)
+        deleted = cursor.rowcount
+        tree_stats.forget(cursor, category_ids)
+        return deleted
+
+    @staticmethod
+    def delete(category_id, chunk_size=None):
+        deleted = 0
+        if chunk_size:
+            # Поддерево без корня удаляется порциями в отдельных транзакциях
+            # (в сессии — точках сохранения). Статистика предков не меняется, пока не удалён корень
+            with get_connection() as conn:
+                ids = Category._subtree_ids(conn.cursor(), category_id)[:-1]
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                with session() as conn, change_log.own_changes():
+                    deleted += Category._delete_rows(conn.cursor(), chunk)
+                    tree_index.stage('on_deleted', chunk)
+                    after_commit(partial(events.publish, events.DELETED, category_id, deleted_ids=chunk))
+
+        with session() as conn, change_log.own_changes():
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM categories WHERE id = ? OR parent_id = ?",
-                           (category_id, category_id))
-            conn.commit()
-            return cursor.rowcount > 0
+            # Повторный сбор подхватывает узлы, добавленные между порциями
+            ids = Category._subtree_ids(cursor, category_id)
+            parent_id = tree_stats.detach(cursor, category_id)
+            deleted += Category._delete_rows(cursor, ids)
+            tree_stats.refresh_heights(cursor, parent_id)
+            tree_index.stage('on_deleted', ids)
+            if ids:
+                after_commit(partial(events.publish, events.DELETED, category_id,
+                                     parent_id=parent_id, deleted_ids=ids))
+        return deleted
 
     @staticmethod
     def get_children(parent_id=None):
+        return [category for page in Category.iter_children(parent_id, sort='id') for category in page]
+
+    @staticmethod
+    def child_key(category, sort='name'):
+        return tuple(getattr(category, column) for column in CHILD_SORTS[sort])
+
+    @staticmethod
+    def get_children_batch(parent_id=None, after=None, limit=200, sort='name', descending=False):
+        # Keyset-пагинация: after — ключ сортировки (child_key) последней загруженной строки
+        columns = [f"c.{column}" for column in CHILD_SORTS[sort]]
+        direction = "DESC" if descending else "ASC"
+        keyset = ""
+        if after is not None:
+            placeholders = ", ".join("?" * len(columns))
+            keyset = f"AND ({', '.join(columns)}) {'<' if descending else '>'} ({placeholders})"
         with get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT c.id, c.name, c.description, c.parent_id, COALESCE(s.child_count, 0)
+                FROM categories c
+                LEFT JOIN category_stats s ON s.category_id = c.id
+                WHERE c.parent_id IS ? {keyset}
+                ORDER BY {', '.join(f"{column} {direction}" for column in columns)}
+                LIMIT ?
+            """, (parent_id, *(after or ()), limit))
+            return [(Category(*row[:4]), row[4]) for row in cursor.fetchall()]
 
-            if parent_id is None:
-                cursor.execute("""
-                    SELECT id, name, description, parent_id 
-                    FROM categories 
-                    WHERE parent_id IS NULL
-                """)
-            else:
-                cursor.execute("""
-                    SELECT id, name, description, parent_id 
-                    FROM categories 
-                    WHERE parent_id = ?
-                """, (parent_id,))
-
-            rows = cursor.fetchall()
-            return [Category(*row) for row in rows]
+    @staticmethod
+    def get_children_page(parent_id=None, after=None, limit=200, sort='name', descending=False):
+        # Возвращает (категории, ключ для следующей страницы или None)
+        page = [category for category, _ in
+                Category.get_children_batch(parent_id, after, limit, sort, descending)]
+        next_after = Category.child_key(page[-1], sort) if len(page) == limit else None
+        return page, next_after
+
+    @staticmethod
+    def iter_children(parent_id=None, page_size=500, sort='name', descending=False):
+        # Потоковый обход детей страницами: в памяти не больше одной страницы
+        after = None
+        while True:
+            page, after = Category.get_children_page(parent_id, after, page_size, sort, descending)
+            if page:
+                yield page
+            if after is None:
+                return
+
+    @staticmethod
+    def get_subtree_rows(parent_id=None, max_depth=None):
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                WITH RECURSIVE subtree(id, name, description, parent_id, depth) AS (
+                    SELECT id, name, description, parent_id, 0
+                    FROM categories
+                    WHERE parent_id IS ?
+                    UNION ALL
+                    SELECT c.id, c.name, c.description, c.parent_id, s.depth + 1
+                    FROM categories c
+                    JOIN subtree s ON c.parent_id = s.id
+                    WHERE ? IS NULL OR s.depth + 1 < ?
+                )
+                SELECT id, name, description, parent_id, depth
+                FROM subtree
+                ORDER BY id
+            """, (parent_id, max_depth, max_depth))
+            return cursor.fetchall()
+
+    @staticmethod
+    def get_ancestors(category_id):
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT c.id, c.name, c.description, c.parent_id
+                FROM category_closure cl
+                JOIN categories c ON c.id = cl.ancestor_id
+                WHERE cl.descendant_id = ? AND cl.depth > 0
+                ORDER BY cl.depth DESC
+            """, (category_id,))
+            return [Category(*row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def get_path_rows(category_ids):
+        # Пути от корня до каждой категории (включительно) одним запросом на пачку;
+        # общие предки — один и тот же кортеж во всех путях
+        ids = list(dict.fromkeys(category_ids))
+        rows = {}
+        paths = {}
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), MAX_QUERY_PARAMS):
+                chunk = ids[start:start + MAX_QUERY_PARAMS]
+                cursor.execute(f"""
+                    SELECT cl.descendant_id, c.id, c.name, c.description, c.parent_id
+                    FROM category_closure cl
+                    JOIN categories c ON c.id = cl.ancestor_id
+                    WHERE cl.descendant_id IN ({', '.join('?' * len(chunk))})
+                    ORDER BY cl.descendant_id, cl.depth DESC
+                """, chunk)
+                for descendant_id, *row in cursor.fetchall():
+                    row = rows.setdefault(row[0], tuple(row))
+                    paths.setdefault(descendant_id, []).append(row)
+        return paths
+
+    @staticmethod
+    def get_descendants(category_id):
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT c.id, c.name, c.description, c.parent_id
+                FROM category_closure cl
+                JOIN categories c ON c.id = cl.descendant_id
+                WHERE cl.ancestor_id = ? AND cl.depth > 0
+                ORDER BY cl.depth, c.id
+            """, (category_id,))
+            return [Category(*row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def is_descendant(category_id, ancestor_id):
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT 1 FROM category_closure WHERE ancestor_id = ? AND descendant_id = ?",
+                (ancestor_id, category_id)
+            )
+            return cursor.fetchone() is not None
 
     @staticmethod
     def get_all():
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import deque
+from functools import partial
+from typing import Dict, Iterator, List, Optional
+
+from db.database import after_commit, get_connection, session
+
+CHANGE_BATCH = 1000
+
+CHANGE_FIELDS = ('revision', 'kind', 'id', 'name', 'description', 'parent_id', 'changed_at')
+
+# Как часто кэши сверяются с журналом: записи других процессов видны с такой задержкой
+EXTERNAL_CHECK_SECONDS = 0.05
+# Если изменений больше, кэшу дешевле перечитаться целиком
+EXTERNAL_CHANGE_LIMIT = 1000
+# Сколько последних своих диапазонов ревизий помнить; отставший курсор применит старые записи повторно
+OWN_RANGES_SIZE = 256
+
+# После сжатия уцелевшие записи о живых категориях означают «вставить или обновить»
+UPSERT = 'created'
+DELETED = 'deleted'
+
+
+def current_revision() -> int:
+    with get_connection() as conn:
+        row = conn.execute("SELECT MAX(revision) FROM category_changes").fetchone()
+        return row[0] or 0
+
+
+def compacted_revision() -> int:
+    with get_connection() as conn:
+        row = conn.execute("SELECT revision FROM category_changes_compaction WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+
+_own_lock = threading.Lock()
+_own_ranges = deque(maxlen=OWN_RANGES_SIZE)
+
+
+def _add_own_range(low: int, high: int):
+    with _own_lock:
+        # Записи одной транзакции идут подряд: смежные диапазоны склеиваются
+        if _own_ranges and _own_ranges[-1][1] == low:
+            low = _own_ranges.pop()[0]
+        _own_ranges.append((low, high))
+
+
+class own_changes:
+    # Оборачивает запись в categories внутри сессии. Сессия держит блокировку записи до коммита,
+    # так что ревизии между входом и выходом — свои: они уже применены через after_commit, курсоры их пропускают
+    def __enter__(self):
+        self.low = current_revision()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            high = current_revision()
+            if high > self.low:
+                after_commit(partial(_add_own_range, self.low, high))
+        return False
+
+
+def _read(since: int, until: Optional[int], limit: Optional[int] = None) -> List[tuple]:
+    with get_connection() as conn:
+        return conn.execute("""
+            SELECT revision, kind, category_id, name, description, parent_id, changed_at
+            FROM category_changes
+            WHERE revision > ? AND (? IS NULL OR revision <= ?)
+            ORDER BY revision
+            LIMIT ?
+        """, (since, until, until, -1 if limit is None else limit)).fetchall()
+
+
+def _parents_first(rows: List[tuple]) -> List[tuple]:
+    # В сжатой части ревизия записи — последнее изменение категории, и ребёнок может идти раньше родителя.
+    # Порядок восстанавливается по parent_id внутри пачки; удаления идут после, в исходном порядке
+    upserts = {row[2]: row for row in rows if row[1] != DELETED}
+    depths = {}
+    for category_id in upserts:
+        chain = []
+        current = category_id
+        while current in upserts and current not in depths and current not in chain:
+            chain.append(current)
+            current = upserts[current][5]
+        depth = depths.get(current, -1) + 1 if current in depths else 0
+        for node in reversed(chain):
+            depths[node] = depth
+            depth += 1
+    ordered = sorted(upserts.values(), key=lambda row: (depths[row[2]], row[0]))
+    return ordered + [row for row in rows if row[1] == DELETED]
+
+
+class ChangeCursor:
+    # Позиция кэша в журнале: через неё видны записи, сделанные мимо этого процесса
+    def __init__(self, interval: float = EXTERNAL_CHECK_SECONDS, limit: int = EXTERNAL_CHANGE_LIMIT):
+        self.interval = interval
+        self.limit = limit
+        self.revision: Optional[int] = None
+        self._checked = 0.0
+
+    def start(self):
+        # Вызывается перед полной загрузкой кэша: более ранние изменения в неё уже входят
+        self.revision = current_revision()
+        self._checked = time.monotonic()
+
+    def poll(self) -> Optional[List[Dict]]:
+        # [] — нового нет или проверять ещё рано; None — кэш надо перечитать целиком
+        if self.revision is None:
+            return None
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return []
+        self._checked = now
+        with _own_lock:
+            skips = sorted(own for own in _own_ranges if own[1] > self.revision)
+        # Читаются только чужие ревизии: между своими диапазонами и после последнего
+        rows = []
+        revision = self.revision
+        for low, high in skips:
+            if revision < low:
+                rows += _read(revision, low, self.limit + 1 - len(rows))
+                if len(rows) > self.limit:
+                    return None
+            revision = max(revision, high)
+        rows += _read(revision, None, self.limit + 1 - len(rows))
+        if len(rows) > self.limit:
+            return None
+        self.revision = max(revision, rows[-1][0]) if rows else revision
+        return [dict(zip(CHANGE_FIELDS, row)) for row in rows]
+
+
+def iter_changes(since: int = 0, batch_size: int = CHANGE_BATCH,
+                 until: Optional[int] = None) -> Iterator[Dict]:
+    # Изменения с ревизией больше since. Сжатая часть журнала отдаётся одной пачкой родители-первыми,
+    # дальше — порциями по возрастанию ревизии
+    floor = compacted_revision()
+    if since < floor:
+        bound = floor if until is None else min(floor, until)
+        for row in _parents_first(_read(since, bound)):
+            yield dict(zip(CHANGE_FIELDS, row))
+        since = bound
+    while until is None or since < until:
+        rows = _read(since, until, batch_size)
+        for row in rows:
+            yield dict(zip(CHANGE_FIELDS, row))
+        if len(rows) < batch_size:
+            return
+        since = rows[-1][0]
+
+
+def compact(before_revision: int) -> int:
+    # До before_revision включительно остаётся последняя запись каждой категории в этом диапазоне.
+    # Записи полные, поэтому потребитель с любой ревизией получает то же итоговое состояние
+    with session() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM category_changes
+            WHERE revision <= :before
+              AND EXISTS (
+                  SELECT 1 FROM category_changes later
+                  WHERE later.category_id = category_changes.category_id
+                    AND later.revision > category_changes.revision
+                    AND later.revision <= :before
+              )
+        """, {'before': before_revision})
+        removed = cursor.rowcount
+        cursor.execute("UPDATE category_changes SET kind = ? WHERE revision <= ? AND kind != ?",
+                       (UPSERT, before_revision, DELETED))
+        cursor.execute("""
+            INSERT INTO category_changes_compaction (id, revision) VALUES (1, ?)
+            ON CONFLICT (id) DO UPDATE SET revision = MAX(revision, excluded.revision)
+        """, (before_revision,))
+        return removed
@@ -0,0 +1,107 @@
+import threading
+import traceback
+import weakref
+from typing import Callable, List, Optional, Sequence
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+MOVED = 'moved'
+# Массовое изменение (импорт): подписчикам проще перечитать дерево целиком
+RESET = 'reset'
+
+
+class CategoryEvent:
+    __slots__ = ('kind', 'category_id', 'name', 'description', 'parent_id', 'old_parent_id', 'deleted_ids')
+
+    def __init__(self, kind, category_id=None, name=None, description=None, parent_id=None,
+                 old_parent_id=None, deleted_ids=()):
+        self.kind = kind
+        self.category_id = category_id
+        self.name = name
+        self.description = description
+        self.parent_id = parent_id
+        self.old_parent_id = old_parent_id
+        self.deleted_ids = tuple(deleted_ids)
+
+    @property
+    def row(self):
+        return self.category_id, self.name, self.description, self.parent_id
+
+    def __repr__(self):
+        return f"CategoryEvent({self.kind}, {self.category_id})"
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, callback: Callable[[CategoryEvent], None]) -> Callable[[], None]:
+        # Связанные методы хранятся по слабой ссылке: удалённый подписчик отписывается сам
+        ref = weakref.WeakMethod(callback) if hasattr(callback, '__self__') else (lambda: callback)
+        with self._lock:
+            self._subscribers.append(ref)
+
+        def unsubscribe():
+            with self._lock:
+                if ref in self._subscribers:
+                    self._subscribers.remove(ref)
+        return unsubscribe
+
+    def publish(self, event: CategoryEvent):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for ref in subscribers:
+            callback = ref()
+            if callback is None:
+                with self._lock:
+                    if ref in self._subscribers:
+                        self._subscribers.remove(ref)
+                continue
+            try:
+                callback(event)
+            except Exception:
+                # Запись уже зафиксирована: ошибка подписчика не должна её прерывать
+                traceback.print_exc()
+
+
+def _merge(previous: CategoryEvent, event: CategoryEvent) -> CategoryEvent:
+    if previous.kind == CREATED:
+        kind = CREATED
+    elif MOVED in (previous.kind, event.kind):
+        kind = MOVED
+    else:
+        kind = UPDATED
+    old_parent_id = previous.old_parent_id if previous.kind == MOVED else event.old_parent_id
+    return CategoryEvent(kind, event.category_id, event.name, event.description, event.parent_id, old_parent_id)
+
+
+def coalesce(events: Sequence[CategoryEvent]) -> List[CategoryEvent]:
+    # Пачка событий сводится к одному удалению и последнему состоянию каждой затронутой категории
+    if any(event.kind == RESET for event in events):
+        return [CategoryEvent(RESET)]
+
+    changed = {}
+    deleted = {}
+    for event in events:
+        if event.kind == DELETED:
+            for category_id in event.deleted_ids:
+                changed.pop(category_id, None)
+                deleted[category_id] = None
+            continue
+        previous = changed.get(event.category_id)
+        changed[event.category_id] = event if previous is None else _merge(previous, event)
+
+    result = []
+    if deleted:
+        result.append(CategoryEvent(DELETED, deleted_ids=deleted))
+    result.extend(changed.values())
+    return result
+
+
+category_events = EventBus()
+
+
+def publish(kind: str, category_id: Optional[int] = None, **fields):
+    category_events.publish(CategoryEvent(kind, category_id, **fields))
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db.database import in_session
+from models import change_log, events
+from models.category import Category
+
+PATH_CACHE_SIZE = 10000
+
+Row = Tuple[int, str, Optional[str], Optional[int]]
+
+
+class PathCache:
+    def __init__(self, max_size: int = PATH_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._paths: "OrderedDict[int, Tuple[Row, ...]]" = OrderedDict()
+        # Узел -> закэшированные пути, в которые он входит
+        self._members: Dict[int, set] = {}
+        # Растёт при каждой инвалидации: путь, прочитанный до неё, в кэш не кладём
+        self._generation = 0
+        self._changes = change_log.ChangeCursor()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict:
+        return {'size': len(self._paths), 'hits': self.hits, 'misses': self.misses}
+
+    def _store(self, category_id: int, path: Tuple[Row, ...]):
+        self._paths[category_id] = path
+        for row in path:
+            self._members.setdefault(row[0], set()).add(category_id)
+        while len(self._paths) > self.max_size:
+            self._drop(next(iter(self._paths)))
+
+    def _drop(self, category_id: int):
+        path = self._paths.pop(category_id, None)
+        if path is None:
+            return
+        for row in path:
+            members = self._members.get(row[0])
+            if members is not None:
+                members.discard(category_id)
+                if not members:
+                    del self._members[row[0]]
+
+    def get_path_rows(self, category_ids: Iterable[int]) -> Dict[int, Tuple[Row, ...]]:
+        ids = list(dict.fromkeys(category_ids))
+        if in_session():
+            # События незакоммиченных записей ещё не разосланы: кэш в обход, чтобы видеть их
+            return {category_id: tuple(path) for category_id, path in Category.get_path_rows(ids).items()}
+
+        result = {}
+        with self._lock:
+            self._apply_external()
+            for category_id in ids:
+                path = self._paths.get(category_id)
+                if path is not None:
+                    self._paths.move_to_end(category_id)
+                    result[category_id] = path
+            self.hits += len(result)
+            self.misses += len(ids) - len(result)
+            generation = self._generation
+
+        missing = [category_id for category_id in ids if category_id not in result]
+        if not missing:
+            return result
+
+        loaded = {category_id: tuple(path) for category_id, path in Category.get_path_rows(missing).items()}
+        result.update(loaded)
+        with self._lock:
+            if generation == self._generation:
+                for category_id, path in loaded.items():
+                    self._store(category_id, path)
+        return result
+
+    def _apply_external(self):
+        # Записи других процессов событий не присылают: они видны через журнал изменений
+        changes = self._changes.poll()
+        if changes is None:
+            self._clear()
+            self._changes.start()
+        elif changes:
+            self._invalidate(change['id'] for change in changes)
+
+    def get_paths(self, category_ids: Iterable[int], include_self: bool = True) -> Dict[int, List[Category]]:
+        # Отсутствующие id в результат не попадают; общие предки — один объект на вызов
+        categories = {}
+        result = {}
+        for category_id, path in self.get_path_rows(category_ids).items():
+            if not include_self:
+                path = path[:-1]
+            result[category_id] = [
+                categories.get(row[0]) or categories.setdefault(row[0], Category(*row))
+                for row in path
+            ]
+        return result
+
+    def invalidate(self, category_ids: Iterable[int]):
+        with self._lock:
+            self._invalidate(category_ids)
+
+    def _invalidate(self, category_ids: Iterable[int]):
+        # Сбрасываются только пути, проходящие через изменённые узлы
+        self._generation += 1
+        for category_id in category_ids:
+            for member in list(self._members.get(category_id, ())):
+                self._drop(member)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._generation += 1
+        self._paths.clear()
+        self._members.clear()
+
+    def on_event(self, event: events.CategoryEvent):
+        if event.kind == events.RESET:
+            self.clear()
+        elif event.kind == events.DELETED:
+            self.invalidate(event.deleted_ids)
+        elif event.kind in (events.UPDATED, events.MOVED):
+            self.invalidate([event.category_id])
+
+
+path_cache = PathCache()
+events.category_events.subscribe(path_cache.on_event)
@@ -0,0 +1,222 @@
+import threading
+from bisect import insort
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from db.database import after_commit, get_connection, on_rollback
+from models import change_log
+
+Row = Tuple[int, str, Optional[str], Optional[int]]
+
+
+class TreeIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rows: Optional[Dict[int, Row]] = None
+        self._children: Dict[Optional[int], List[int]] = {}
+        self._names: Dict[str, List[int]] = {}
+        # Поток с незакоммиченными записями читает свою копию индекса, общий индекс правится после коммита
+        self._local = threading.local()
+        self._changes = change_log.ChangeCursor()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._rows is not None
+
+    def load(self):
+        self._changes.start()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name, description, parent_id FROM categories ORDER BY id")
+            rows = cursor.fetchall()
+
+        with self._lock:
+            self._rows = {}
+            self._children = {}
+            self._names = {}
+            for row in rows:
+                self._insert(row)
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+            self._children = {}
+            self._names = {}
+
+    def stats(self) -> Dict:
+        return {
+            'loaded': self.loaded,
+            'size': len(self._rows) if self._rows is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def _warm(self) -> Dict[int, Row]:
+        with self._lock:
+            if self._rows is not None:
+                self._apply_external()
+            if self._rows is None:
+                self.misses += 1
+                self.load()
+            else:
+                self.hits += 1
+            return self._rows
+
+    def _apply_external(self):
+        # Журнал содержит и свои записи, уже применённые после коммита: повторное применение их не меняет
+        changes = self._changes.poll()
+        if changes is None:
+            self._rows = None
+            return
+        for change in changes:
+            self._remove(change['id'])
+            if change['kind'] != change_log.DELETED:
+                self._insert((change['id'], change['name'], change['description'], change['parent_id']))
+
+    def stage(self, method: str, *args):
+        # Вызывается внутри сессии: on_rollback и after_commit срабатывают ровно одно из двух
+        local = self._local
+        local.staged = getattr(local, 'staged', 0) + 1
+        overlay = getattr(local, 'overlay', None)
+        if overlay is not None:
+            getattr(overlay, method)(*args)
+        on_rollback(partial(self._unstage))
+        after_commit(partial(self._commit_staged, method, args))
+
+    def _unstage(self):
+        # Копия могла видеть откаченные строки: при следующем чтении перечитается из соединения сессии
+        self._local.staged -= 1
+        self._local.overlay = None
+
+    def _commit_staged(self, method: str, args: tuple):
+        self._local.staged -= 1
+        if not self._local.staged:
+            self._local.overlay = None
+        getattr(self, method)(*args)
+
+    def _view(self) -> "TreeIndex":
+        local = self._local
+        if not getattr(local, 'staged', 0):
+            return self
+        overlay = getattr(local, 'overlay', None)
+        if overlay is None:
+            overlay = local.overlay = TreeIndex()
+        return overlay
+
+    def _insert(self, row: Row):
+        category_id, name, _, parent_id = row
+        self._rows[category_id] = row
+        insort(self._children.setdefault(parent_id, []), category_id)
+        insort(self._names.setdefault(name.lower(), []), category_id)
+
+    def _remove(self, category_id: int):
+        row = self._rows.pop(category_id, None)
+        if row is None:
+            return
+        _, name, _, parent_id = row
+        self._discard(self._children, parent_id, category_id)
+        self._discard(self._names, name.lower(), category_id)
+
+    @staticmethod
+    def _discard(mapping, key, category_id):
+        ids = mapping.get(key)
+        if ids is None:
+            return
+        ids.remove(category_id)
+        if not ids:
+            del mapping[key]
+
+    # Вызываются из Category после коммита, индекс правится на месте
+
+    def on_created(self, row: Row):
+        with self._lock:
+            if self._rows is not None:
+                # Строку мог уже подхватить load() другого потока, начатый после коммита
+                self._remove(row[0])
+                self._insert(row)
+
+    def on_updated(self, category_id: int, name: str, description: Optional[str]):
+        with self._lock:
+            if self._rows is None or category_id not in self._rows:
+                return
+            parent_id = self._rows[category_id][3]
+            self._remove(category_id)
+            self._insert((category_id, name, description, parent_id))
+
+    def on_moved(self, category_id: int, parent_id: Optional[int]):
+        # Поддерево переезжает вместе с узлом: у потомков parent_id не меняется
+        with self._lock:
+            if self._rows is None or category_id not in self._rows:
+                return
+            _, name, description, _ = self._rows[category_id]
+            self._remove(category_id)
+            self._insert((category_id, name, description, parent_id))
+
+    def on_deleted(self, category_ids: List[int]):
+        with self._lock:
+            if self._rows is None:
+                return
+            for category_id in category_ids:
+                self._remove(category_id)
+
+    def get(self, category_id: int) -> Optional[Row]:
+        view = self._view()
+        if view is not self:
+            return view.get(category_id)
+        return self._warm().get(category_id)
+
+    def children(self, parent_id: Optional[int]) -> List[int]:
+        view = self._view()
+        if view is not self:
+            return view.children(parent_id)
+        self._warm()
+        return list(self._children.get(parent_id, ()))
+
+    def ancestors(self, category_id: int) -> List[int]:
+        view = self._view()
+        if view is not self:
+            return view.ancestors(category_id)
+        rows = self._warm()
+        result = []
+        row = rows.get(category_id)
+        while row is not None and row[3] is not None:
+            result.append(row[3])
+            row = rows.get(row[3])
+        return result
+
+    def descendants(self, category_id: Optional[int]) -> List[int]:
+        view = self._view()
+        if view is not self:
+            return view.descendants(category_id)
+        self._warm()
+        result = []
+        stack = list(reversed(self._children.get(category_id, ())))
+        while stack:
+            current = stack.pop()
+            result.append(current)
+            stack.extend(reversed(self._children.get(current, ())))
+        return result
+
+    def find_by_name(self, name: str, parent_id: Optional[int] = None) -> Optional[Row]:
+        view = self._view()
+        if view is not self:
+            return view.find_by_name(name, parent_id)
+        rows = self._warm()
+        best_key = None
+        for category_id in self._names.get(name.lower(), ()):
+            key = [category_id]
+            current = rows[category_id][3]
+            while current != parent_id and current in rows:
+                key.append(current)
+                current = rows[current][3]
+            if current != parent_id:
+                continue
+            key.reverse()
+            if best_key is None or key < best_key:
+                best_key = key
+        return rows[best_key[-1]] if best_key else None
+
+
+tree_index = TreeIndex()
@@ -0,0 +1,152 @@
+from typing import Dict, List, Optional
+
+from db.database import compute_tree_stats, get_connection, rebuild_tree_stats
+
+STAT_COLUMNS = ('child_count', 'node_count', 'height', 'leaf_count', 'branch_count')
+
+
+def _read(cursor, category_id):
+    cursor.execute("""
+        SELECT child_count, node_count, height, leaf_count, branch_count
+        FROM category_stats
+        WHERE category_id = ?
+    """, (category_id,))
+    return cursor.fetchone()
+
+
+def _parent_of(cursor, category_id):
+    cursor.execute("SELECT parent_id FROM categories WHERE id = ?", (category_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def attach(cursor, category_id: int, parent_id: Optional[int]):
+    # Вызывается после вставки или переноса узла, closure уже указывает на новых предков
+    cursor.execute("INSERT OR IGNORE INTO category_stats (category_id) VALUES (?)", (category_id,))
+    if parent_id is None:
+        return
+
+    parent = _read(cursor, parent_id)
+    if parent is None:
+        return
+
+    _, node_count, height, leaf_count, branch_count = _read(cursor, category_id)
+    parent_child_count = parent[0]
+    cursor.execute("""
+        UPDATE category_stats
+        SET node_count = node_count + :nodes,
+            leaf_count = leaf_count + :leaves,
+            branch_count = branch_count + :branches,
+            height = MAX(height, (
+                SELECT depth + :height FROM category_closure
+                WHERE ancestor_id = category_stats.category_id AND descendant_id = :id
+            ))
+        WHERE category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = :parent)
+    """, {
+        'id': category_id,
+        'parent': parent_id,
+        'nodes': node_count,
+        'height': height,
+        'leaves': leaf_count - (1 if parent_child_count == 0 else 0),
+        'branches': branch_count + (1 if parent_child_count == 1 else 0),
+    })
+    cursor.execute(
+        "UPDATE category_stats SET child_count = child_count + 1 WHERE category_id = ?",
+        (parent_id,)
+    )
+
+
+def detach(cursor, category_id: int) -> Optional[int]:
+    # Вызывается до удаления или переноса узла; высоты предков пересчитывает refresh_heights
+    parent_id = _parent_of(cursor, category_id)
+    current = _read(cursor, category_id)
+    if parent_id is None or current is None:
+        return parent_id
+
+    parent = _read(cursor, parent_id)
+    if parent is None:
+        return parent_id
+
+    _, node_count, _, leaf_count, branch_count = current
+    remaining = parent[0] - 1
+    cursor.execute("""
+        UPDATE category_stats
+        SET node_count = node_count - :nodes,
+            leaf_count = leaf_count - :leaves,
+            branch_count = branch_count - :branches
+        WHERE category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = :parent)
+    """, {
+        'parent': parent_id,
+        'nodes': node_count,
+        'leaves': leaf_count - (1 if remaining == 0 else 0),
+        'branches': branch_count + (1 if remaining == 1 else 0),
+    })
+    cursor.execute(
+        "UPDATE category_stats SET child_count = child_count - 1 WHERE category_id = ?",
+        (parent_id,)
+    )
+    return parent_id
+
+
+def refresh_heights(cursor, category_id: Optional[int]):
+    while category_id is not None:
+        stored = _read(cursor, category_id)
+        if stored is None:
+            return
+        cursor.execute("""
+            SELECT 1 + COALESCE(MAX(s.height), 0)
+            FROM categories c
+            JOIN category_stats s ON s.category_id = c.id
+            WHERE c.parent_id = ?
+        """, (category_id,))
+        height = cursor.fetchone()[0]
+        if height == stored[2]:
+            return
+        cursor.execute("UPDATE category_stats SET height = ? WHERE category_id = ?", (height, category_id))
+        category_id = _parent_of(cursor, category_id)
+
+
+def rebuild_subtree(cursor, category_id: int, parent_id: Optional[int]):
+    stats = compute_tree_stats(cursor, category_id)
+    cursor.executemany("""
+        INSERT OR REPLACE INTO category_stats (category_id, child_count, node_count, height, leaf_count, branch_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, ((node_id, *values) for node_id, values in stats.items()))
+    attach(cursor, category_id, parent_id)
+
+
+def forget(cursor, category_ids: List[int]):
+    cursor.executemany("DELETE FROM category_stats WHERE category_id = ?",
+                       ((category_id,) for category_id in category_ids))
+
+
+def get_stats(category_id: int) -> Optional[Dict]:
+    with get_connection() as conn:
+        row = _read(conn.cursor(), category_id)
+        return dict(zip(STAT_COLUMNS, row)) if row else None
+
+
+def verify_stats(repair: bool = False) -> List[Dict]:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        expected = compute_tree_stats(cursor)
+        cursor.execute("""
+            SELECT category_id, child_count, node_count, height, leaf_count, branch_count
+            FROM category_stats
+        """)
+        stored = {row[0]: row[1:] for row in cursor.fetchall()}
+        if repair and stored != expected:
+            rebuild_tree_stats(cursor)
+            conn.commit()
+
+    drift = []
+    for category_id in sorted(expected.keys() | stored.keys()):
+        actual = stored.get(category_id)
+        wanted = expected.get(category_id)
+        if actual != wanted:
+            drift.append({
+                'category_id': category_id,
+                'stored': dict(zip(STAT_COLUMNS, actual)) if actual else None,
+                'expected': dict(zip(STAT_COLUMNS, wanted)) if wanted else None
+            })
+    return drift
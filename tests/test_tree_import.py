@@ -0,0 +1,63 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from db import database
+from models.category import Category
+from utils.tree_import import import_tree
+
+
+class ImportTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = database.DB_PATH
+        database.configure(path=Path(self.tmp.name) / 'test.db')
+        database.init_db()
+
+    def tearDown(self):
+        database.configure(path=self.db_path)
+        self.tmp.cleanup()
+
+    def write(self, name, text, newline=None):
+        path = Path(self.tmp.name) / name
+        with open(path, 'w', encoding='utf-8', newline=newline) as file:
+            file.write(text)
+        return str(path)
+
+    def rows(self):
+        return sorted((c.name, c.description, c.parent_id) for c in Category.get_all())
+
+    def test_json_keys_after_children(self):
+        tree = [{'name': 'Корень', 'description': 'описание', 'children': [
+            {'name': 'Ветка', 'children': [{'name': 'Лист', 'description': 'лист'}]},
+            {'name': 'Пустая', 'description': None, 'children': []},
+        ]}]
+        self.assertEqual(import_tree(self.write('tree.json', json.dumps(tree, sort_keys=True))), 4)
+        root = Category.get_children(None)[0]
+        branch = {c.name: c for c in Category.get_children(root.id)}
+        self.assertEqual((root.name, root.description), ('Корень', 'описание'))
+        self.assertEqual(set(branch), {'Ветка', 'Пустая'})
+        leaf = Category.get_children(branch['Ветка'].id)[0]
+        self.assertEqual((leaf.name, leaf.description), ('Лист', 'лист'))
+
+    def test_json_name_after_children(self):
+        text = '[{"children": [{"name": "b"}], "description": "d", "name": "a"}]'
+        self.assertEqual(import_tree(self.write('tree.json', text)), 2)
+        root = Category.get_children(None)[0]
+        self.assertEqual((root.name, root.description), ('a', 'd'))
+        self.assertEqual([c.name for c in Category.get_children(root.id)], ['b'])
+
+    def test_json_without_name(self):
+        with self.assertRaisesRegex(ValueError, "without 'name'"):
+            import_tree(self.write('tree.json', '[{"children": [{"name": "b"}]}]'))
+        self.assertEqual(self.rows(), [])
+
+    def test_text_with_crlf(self):
+        text = "└── R (ID: 1)\n    Description: первая\n    вторая\n    └── C (ID: 2)\n"
+        self.assertEqual(import_tree(self.write('tree.txt', text, newline='\r\n')), 2)
+        self.assertEqual(self.rows(), [('C', None, 1), ('R', 'первая\nвторая', None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,466 @@
+import sqlite3
+from bisect import bisect_left, bisect_right
+
+from PyQt6.QtCore import QAbstractItemModel, QByteArray, QMimeData, QModelIndex, QPoint, Qt, QTimer, pyqtSignal
+from PyQt6 import sip
+from PyQt6.QtWidgets import QAbstractItemView
+
+from models import events, tree_stats
+from models.category import Category
+from ui.workers import TaskRunner
+
+CATEGORY_ID_ROLE = 100
+CATEGORY_MIME_TYPE = 'application/x-category-ids'
+
+
+class _Node:
+    __slots__ = ('category', 'parent', 'row', 'children', 'child_count', 'exhausted', 'loading', 'requested')
+
+    def __init__(self, category, parent, row, child_count):
+        self.category = category
+        self.parent = parent
+        self.row = row
+        self.children = []
+        self.child_count = child_count
+        self.exhausted = child_count == 0
+        self.loading = False
+        self.requested = False
+
+
+def _load_root_entry(category_id):
+    category = Category.get_by_id(category_id)
+    if category is None:
+        return []
+    stats = tree_stats.get_stats(category_id)
+    return [(category, stats['child_count'] if stats else 0)]
+
+
+class CategoryTreeModel(QAbstractItemModel):
+    BATCH_SIZE = 200
+    # Окно, в течение которого события изменений копятся и применяются одной пачкой
+    COALESCE_MS = 50
+
+    loading_changed = pyqtSignal(bool)
+    load_failed = pyqtSignal(str)
+    move_failed = pyqtSignal(str)
+    # Переносит события шины из любого потока в поток модели
+    category_event = pyqtSignal(object)
+
+    def __init__(self, root_id=None, headers=("Категория", "Описание"), include_root=False, threaded=False,
+                 sort='name', descending=False, parent=None):
+        super().__init__(parent)
+        self.root_id = root_id
+        self.sort = sort
+        self.descending = descending
+        self.headers = headers
+        self.include_root = include_root
+        self.runner = TaskRunner(self) if threaded else None
+        self._root = _Node(None, None, 0, -1)
+        self._generation = 0
+        self._pending = 0
+        self._inserting = False
+        self._nodes = {}
+        self._removed = set()
+        self._queued = []
+
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(self.COALESCE_MS)
+        self._flush_timer.timeout.connect(self._apply_events)
+        self.category_event.connect(self._queue_event)
+        self._unsubscribe = events.category_events.subscribe(self._on_category_event)
+
+    def cancel(self):
+        if self.runner is not None:
+            self.runner.cancel_all()
+        self._generation += 1
+        self._set_pending(0)
+
+    def close(self):
+        self.cancel()
+        self._unsubscribe()
+        self._flush_timer.stop()
+        self._queued = []
+
+    def set_sort(self, sort, descending=False):
+        if (sort, descending) != (self.sort, self.descending):
+            self.sort = sort
+            self.descending = descending
+            self.reload()
+
+    def reload(self):
+        self.cancel()
+        self.beginResetModel()
+        self._root = _Node(None, None, 0, -1)
+        self._nodes = {}
+        self._removed = set()
+        self._queued = []
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def _set_pending(self, pending):
+        was_loading = self._pending > 0
+        self._pending = pending
+        if was_loading != (pending > 0):
+            self.loading_changed.emit(pending > 0)
+
+    def _node(self, index):
+        return index.internalPointer() if index.isValid() else self._root
+
+    def _index_of(self, node):
+        if node is self._root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def category_id(self, index):
+        if not index.isValid():
+            return None
+        return self._node(index).category.id
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self._node(parent)
+        if row < 0 or row >= len(node.children) or column < 0 or column >= len(self.headers):
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index=QModelIndex()):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self._root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._node(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return False
+        node = self._node(parent)
+        return bool(node.children) or not node.exhausted
+
+    def canFetchMore(self, parent):
+        if parent.column() > 0:
+            return False
+        node = self._node(parent)
+        # Раскладка QTreeView спрашивает fetchMore после каждой вставки: без этого фоновые пачки
+        # догружали бы узел целиком. Следующие пачки — только по request_more (прокрутка к концу)
+        if node.children and not node.requested:
+            return False
+        return not self._inserting and not node.loading and not node.exhausted
+
+    def request_more(self, parent):
+        node = self._node(parent)
+        if node.exhausted or node.loading:
+            return
+        node.requested = True
+        self.fetchMore(parent)
+
+    def _batch_request(self, node):
+        if node is self._root and self.include_root:
+            return _load_root_entry, (self.root_id,)
+        parent_id = node.category.id if node.category is not None else self.root_id
+        after = self._key(node.children[-1].category) if node.children else None
+        return Category.get_children_batch, (parent_id, after, self.BATCH_SIZE, self.sort, self.descending)
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+        node = self._node(parent)
+        loader, args = self._batch_request(node)
+
+        node.loading = True
+        node.requested = False
+        if self.runner is None:
+            self._insert_batch(node, self._generation, loader(*args))
+            return
+
+        generation = self._generation
+        self._set_pending(self._pending + 1)
+        self.runner.submit(
+            loader, *args,
+            on_result=lambda batch: self._insert_batch(node, generation, batch),
+            on_error=lambda message: self._batch_failed(node, generation, message)
+        )
+
+    def _finish_request(self, node, generation):
+        if generation != self._generation:
+            return False
+        node.loading = False
+        if self.runner is not None:
+            self._set_pending(self._pending - 1)
+        return True
+
+    def _batch_failed(self, node, generation, message):
+        if self._finish_request(node, generation):
+            self.load_failed.emit(message)
+
+    def _insert_batch(self, node, generation, batch):
+        if not self._finish_request(node, generation):
+            return
+        if len(batch) < self.BATCH_SIZE or (node is self._root and self.include_root):
+            node.exhausted = True
+        # Строки, уже добавленные или удалённые по событиям, пока запрос был в пути
+        batch = [(category, child_count) for category, child_count in batch
+                 if category.id not in self._nodes and category.id not in self._removed]
+        if not batch:
+            return
+
+        # Представление может повторно вызвать fetchMore из beginInsertRows
+        self._inserting = True
+        try:
+            start = len(node.children)
+            self.beginInsertRows(self._index_of(node), start, start + len(batch) - 1)
+            for offset, (category, child_count) in enumerate(batch):
+                child = _Node(category, node, start + offset, child_count)
+                node.children.append(child)
+                self._nodes[category.id] = child
+            self.endInsertRows()
+        finally:
+            self._inserting = False
+
+    # Точечное обновление по событиям Category вместо полной перезагрузки
+
+    def _on_category_event(self, event):
+        self.category_event.emit(event)
+
+    def _queue_event(self, event):
+        self._queued.append(event)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def _apply_events(self):
+        queued, self._queued = self._queued, []
+        for event in events.coalesce(queued):
+            if event.kind == events.RESET:
+                self.reload()
+                return
+            if event.kind == events.DELETED:
+                self._apply_deleted(event.deleted_ids)
+            else:
+                self._apply_changed(Category(*event.row), event.kind, event.old_parent_id)
+
+    def _parent_node(self, parent_id):
+        if not self.include_root and parent_id == self.root_id:
+            return self._root
+        return self._nodes.get(parent_id)
+
+    def _key(self, category):
+        return Category.child_key(category, self.sort)
+
+    def _slot(self, parent, category, exclude=None):
+        # Позиция среди загруженных детей; None — строка за пределами загруженного окна
+        keys = [self._key(child.category) for child in parent.children if child is not exclude]
+        key = self._key(category)
+        if self.descending:
+            position = len(keys) - bisect_right(keys[::-1], key)
+        else:
+            position = bisect_left(keys, key)
+        if position == len(keys) and not parent.exhausted:
+            return None
+        return position
+
+    @staticmethod
+    def _renumber(parent, start=0):
+        for row in range(start, len(parent.children)):
+            parent.children[row].row = row
+
+    def _forget(self, node):
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self._nodes.pop(current.category.id, None)
+            stack.extend(current.children)
+
+    def _detach(self, node):
+        parent, row = node.parent, node.row
+        self.beginRemoveRows(self._index_of(parent), row, row)
+        parent.children.pop(row)
+        self._renumber(parent, row)
+        self.endRemoveRows()
+        self._forget(node)
+
+    def _apply_deleted(self, deleted_ids):
+        deleted = set(deleted_ids)
+        self._removed |= deleted
+        for category_id in deleted_ids:
+            node = self._nodes.get(category_id)
+            if node is None:
+                continue
+            parent = node.parent
+            if parent.category is not None and parent.category.id in deleted:
+                continue
+            self._detach(node)
+            parent.child_count = max(parent.child_count - 1, 0)
+
+    def _apply_changed(self, category, kind, old_parent_id=None):
+        node = self._nodes.get(category.id)
+        target = self._parent_node(category.parent_id)
+        if kind == events.MOVED:
+            source = self._parent_node(old_parent_id)
+            if source is not None:
+                source.child_count = max(source.child_count - 1, 0)
+        position = None
+        if target is not None:
+            position = self._slot(target, category, exclude=node)
+            if kind in (events.CREATED, events.MOVED):
+                target.child_count += 1
+
+        if node is None:
+            if position is not None:
+                # Про детей ранее не загруженной строки ничего не известно: они догрузятся при раскрытии
+                child_count = 0 if kind == events.CREATED else -1
+                self._attach(_Node(category, target, position, child_count), target, position)
+            return
+
+        old_parent = node.parent
+        node.category = category
+        if position is None:
+            self._detach(node)
+            return
+        if target is old_parent and position == node.row:
+            first = self.createIndex(node.row, 0, node)
+            self.dataChanged.emit(first, first.siblingAtColumn(len(self.headers) - 1))
+            return
+
+        # Перемещение сохраняет выделение и уже загруженное поддерево
+        row = node.row
+        destination = position + 1 if target is old_parent and position > row else position
+        if not self.beginMoveRows(self._index_of(old_parent), row, row, self._index_of(target), destination):
+            self._detach(node)
+            return
+        old_parent.children.pop(row)
+        target.children.insert(position, node)
+        node.parent = target
+        self._renumber(old_parent, min(row, position) if target is old_parent else row)
+        if target is not old_parent:
+            self._renumber(target, position)
+        self.endMoveRows()
+
+    def _attach(self, node, parent, position):
+        self.beginInsertRows(self._index_of(parent), position, position)
+        parent.children.insert(position, node)
+        self._renumber(parent, position)
+        self._nodes[node.category.id] = node
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        category = self._node(index).category
+        if role == Qt.ItemDataRole.DisplayRole:
+            return category.name if index.column() == 0 else (category.description or "")
+        if role == Qt.ItemDataRole.ToolTipRole and index.column() == 1:
+            return category.description or None
+        if role == CATEGORY_ID_ROLE:
+            return category.id
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            # Бросок на пустое место — перенос на верхний уровень модели
+            return Qt.ItemFlag.NoItemFlags if self.include_root else Qt.ItemFlag.ItemIsDropEnabled
+        return (Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+                | Qt.ItemFlag.ItemIsDragEnabled | Qt.ItemFlag.ItemIsDropEnabled)
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [CATEGORY_MIME_TYPE]
+
+    def mimeData(self, indexes):
+        ids = dict.fromkeys(self.category_id(index) for index in indexes if index.isValid())
+        data = QMimeData()
+        data.setData(CATEGORY_MIME_TYPE, QByteArray(",".join(map(str, ids)).encode()))
+        return data
+
+    def _drop_target(self, parent):
+        if parent.isValid():
+            return self.category_id(parent)
+        return self.root_id
+
+    @staticmethod
+    def _dropped_ids(data):
+        raw = bytes(data.data(CATEGORY_MIME_TYPE)).decode()
+        return [int(category_id) for category_id in raw.split(",") if category_id]
+
+    def canDropMimeData(self, data, action, row, column, parent):
+        if action != Qt.DropAction.MoveAction or not data.hasFormat(CATEGORY_MIME_TYPE):
+            return False
+        if not parent.isValid() and self.include_root:
+            return False
+        # Полная проверка циклов — в Category.move_many; здесь отсекается бросок на себя и своих потомков в модели
+        node = self._node(parent)
+        dropped = set(self._dropped_ids(data))
+        while node is not None and node is not self._root:
+            if node.category.id in dropped:
+                return False
+            node = node.parent
+        return True
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if not self.canDropMimeData(data, action, row, column, parent):
+            return False
+        try:
+            Category.move_many(self._dropped_ids(data), self._drop_target(parent))
+        except (ValueError, sqlite3.Error) as e:
+            # Исключение не должно выйти из виртуального метода Qt: это аварийное завершение
+            self.move_failed.emit(str(e))
+            return False
+        # Строки переставит событие MOVED; removeRows у модели нет, так что вид ничего не удалит сам
+        return True
+
+
+def _fetch_visible(view):
+    # Догружается каждый узел, последняя загруженная строка которого видна внизу окна
+    if sip.isdeleted(view):
+        return
+    model = view.model()
+    viewport = view.viewport()
+    bottom = view.indexAt(QPoint(1, viewport.height() - 1))
+    if bottom.isValid():
+        visible = [bottom]
+    else:
+        # Строки не заполняют окно: видны концы всех раскрытых узлов
+        visible = []
+        index = view.indexAt(QPoint(1, 1))
+        while index.isValid():
+            visible.append(index)
+            index = view.indexBelow(index)
+    for index in visible:
+        while index.isValid():
+            parent = index.parent()
+            if index.row() != model.rowCount(parent) - 1:
+                break
+            model.request_more(parent)
+            index = parent
+
+
+def enable_lazy_fetch(view):
+    def schedule(*args):
+        # После вставки раскладка представления ещё не обновлена: проверяем на следующей итерации цикла
+        QTimer.singleShot(0, lambda: _fetch_visible(view))
+
+    view.verticalScrollBar().valueChanged.connect(schedule)
+    view.model().rowsInserted.connect(schedule)
+    view.expanded.connect(schedule)
+
+
+def enable_drag_move(view):
+    view.setDragEnabled(True)
+    view.setAcceptDrops(True)
+    view.setDropIndicatorShown(True)
+    view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+    view.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
@@ -1,10 +1,21 @@
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QTreeWidget, QTreeWidgetItem,
-    QPushButton, QLabel, QInputDialog, QMessageBox, QHBoxLayout, QDialog
+    QMainWindow, QWidget, QVBoxLayout, QTreeView,
+    QPushButton, QLabel, QInputDialog, QMessageBox, QHBoxLayout, QDialog, QComboBox
 )
+from models import tree_stats
 from models.category import Category
 from ui.category_dialog import CategoryDialog
+from ui.category_tree_model import CategoryTreeModel, enable_drag_move, enable_lazy_fetch
+from ui.workers import bind_model_status
+
+
+SORT_OPTIONS = (
+    ("По названию", 'name', False),
+    ("По названию, обратный порядок", 'name', True),
+    ("Сначала старые", 'id', False),
+    ("Сначала новые", 'id', True),
+)
 
 
 class CategoryWindow(QMainWindow):
@@ -36,9 +47,30 @@ class CategoryWindow(QMainWindow):
         self.desc_label = QLabel(f"Описание: {self.category.description or ''}")
         self.layout.addWidget(self.desc_label)
 
+        # Сортировка и счётчик: подкатегории догружаются страницами при прокрутке
+        controls_layout = QHBoxLayout()
+        controls_layout.addWidget(QLabel("Сортировка:"))
+        self.sort_combo = QComboBox()
+        for label, sort, descending in SORT_OPTIONS:
+            self.sort_combo.addItem(label, (sort, descending))
+        self.sort_combo.currentIndexChanged.connect(self.change_sort)
+        controls_layout.addWidget(self.sort_combo)
+        controls_layout.addStretch()
+        self.loaded_label = QLabel()
+        controls_layout.addWidget(self.loaded_label)
+        self.layout.addLayout(controls_layout)
+
         # Дерево подкатегорий
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabels(["Подкатегория", "Описание"])
+        self.model = CategoryTreeModel(self.category_id, headers=("Подкатегория", "Описание"), threaded=True)
+        bind_model_status(self, self.model)
+        self.model.rowsInserted.connect(self.update_loaded_label)
+        self.model.rowsRemoved.connect(self.update_loaded_label)
+        self.model.modelReset.connect(self.update_loaded_label)
+        self.tree = QTreeView()
+        self.tree.setUniformRowHeights(True)
+        self.tree.setModel(self.model)
+        enable_drag_move(self.tree)
+        enable_lazy_fetch(self.tree)
         self.tree.setColumnWidth(0, 300)
         self.layout.addWidget(self.tree)
 
@@ -59,7 +91,7 @@ class CategoryWindow(QMainWindow):
 
         self.layout.addLayout(self.buttons_layout)
 
-        self.tree.itemDoubleClicked.connect(self.open_selected)
+        self.tree.doubleClicked.connect(self.open_selected)
 
         btn_layout = QHBoxLayout()
 
@@ -93,14 +125,21 @@ class CategoryWindow(QMainWindow):
         self.tree_window.show()
 
     def load_subcategories(self):
-        self.tree.clear()
-        subcategories = Category.get_children(self.category_id)
+        self.model.reload()
 
-        for category in subcategories:
-            item = QTreeWidgetItem(self.tree)
-            item.setText(0, category.name)
-            item.setText(1, category.description or "")
-            item.setData(0, 100, category.id)
+    def change_sort(self):
+        sort, descending = self.sort_combo.currentData()
+        self.model.set_sort(sort, descending)
+
+    def update_loaded_label(self, parent=None, *args):
+        if parent is not None and parent.isValid():
+            return
+        stats = tree_stats.get_stats(self.category_id)
+        total = stats['child_count'] if stats else 0
+        self.loaded_label.setText(f"Показано {self.model.rowCount()} из {total}")
+
+    def selected_category_id(self):
+        return self.model.category_id(self.tree.currentIndex())
 
     # Заменяем метод add_subcategory
     def add_subcategory(self):
@@ -112,15 +151,13 @@ class CategoryWindow(QMainWindow):
                 return
 
             Category.create(data["name"], data["description"], self.category_id)
-            self.load_subcategories()
 
     def edit_subcategory(self):
-        selected = self.tree.currentItem()
-        if not selected:
+        category_id = self.selected_category_id()
+        if category_id is None:
             QMessageBox.warning(self, "Ошибка", "Выберите подкатегорию для редактирования")
             return
 
-        category_id = selected.data(0, 100)
         category = Category.get_by_id(category_id)
 
         dialog = CategoryDialog(
@@ -140,19 +177,16 @@ class CategoryWindow(QMainWindow):
                 return
 
             Category.update(category_id, data["name"], data["description"])
-            self.load_subcategories()
 
         elif result == 2:  # Код для удаления
             Category.delete(category_id)
-            self.load_subcategories()
 
     def delete_subcategory(self):
-        selected = self.tree.currentItem()
-        if not selected:
+        category_id = self.selected_category_id()
+        if category_id is None:
             QMessageBox.warning(self, "Ошибка", "Выберите подкатегорию для удаления")
             return
 
-        category_id = selected.data(0, 100)
         category = Category.get_by_id(category_id)
 
         confirm = QMessageBox.question(
@@ -163,21 +197,23 @@ class CategoryWindow(QMainWindow):
         )
 
         if confirm == QMessageBox.StandardButton.Yes:
-            if Category.delete(category_id):
-                self.load_subcategories()
-            else:
+            if not Category.delete(category_id):
                 QMessageBox.warning(self, "Ошибка", "Не удалось удалить подкатегорию")
 
     def open_selected(self):
-        selected = self.tree.currentItem()
-        if not selected:
+        category_id = self.selected_category_id()
+        if category_id is None:
             return
 
-        category_id = selected.data(0, 100)
         self.new_window = CategoryWindow(category_id, self.parent_window)
         self.new_window.show()
+        self.model.cancel()
         self.hide()
 
     def go_back(self):
         self.parent_window.show_main_window()
         self.close()
+
+    def closeEvent(self, event):
+        self.model.close()
+        super().closeEvent(event)
@@ -1,11 +1,14 @@
-from PyQt6.QtGui import QIcon
+from PyQt6.QtGui import QIcon, QKeySequence, QShortcut
 from PyQt6.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QTreeWidget, QTreeWidgetItem,
+    QMainWindow, QWidget, QVBoxLayout, QTreeView,
     QPushButton, QInputDialog, QMessageBox, QDialog, QHBoxLayout
 )
+from db.database import dump_instrumentation, instrumentation
 from models.category import Category
 from ui.category_window import CategoryWindow
 from ui.category_dialog import CategoryDialog
+from ui.category_tree_model import CategoryTreeModel, enable_drag_move, enable_lazy_fetch
+from ui.workers import bind_model_status
 
 
 class MainWindow(QMainWindow):
@@ -24,8 +27,13 @@ class MainWindow(QMainWindow):
         self.load_categories()
 
     def setup_ui(self):
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabels(["Категория", "Описание"])
+        self.model = CategoryTreeModel(headers=("Категория", "Описание"), threaded=True)
+        bind_model_status(self, self.model)
+        self.tree = QTreeView()
+        self.tree.setUniformRowHeights(True)
+        self.tree.setModel(self.model)
+        enable_drag_move(self.tree)
+        enable_lazy_fetch(self.tree)
         self.tree.setColumnWidth(0, 300)
         self.layout.addWidget(self.tree)
 
@@ -37,7 +45,7 @@ class MainWindow(QMainWindow):
         self.open_button.clicked.connect(self.open_selected_category)
         self.layout.addWidget(self.open_button)
 
-        self.tree.itemDoubleClicked.connect(self.open_selected_category)
+        self.tree.doubleClicked.connect(self.open_selected_category)
         btn_layout = QHBoxLayout()
 
         self.add_btn = QPushButton("Добавить")
@@ -53,6 +61,9 @@ class MainWindow(QMainWindow):
         btn_layout.addWidget(self.delete_btn)
         self.layout.addLayout(btn_layout)
         self.delete_btn.setIcon(QIcon.fromTheme("edit-delete"))
+
+        self.sql_stats_shortcut = QShortcut(QKeySequence("Ctrl+Shift+D"), self)
+        self.sql_stats_shortcut.activated.connect(self.dump_sql_stats)
         self.edit_btn.setIcon(QIcon.fromTheme("document-edit"))
 
         self.tree_view_btn = QPushButton("Посмотреть схему")
@@ -61,24 +72,25 @@ class MainWindow(QMainWindow):
 
         btn_layout.addWidget(self.tree_view_btn)
 
+    def selected_category_id(self):
+        return self.model.category_id(self.tree.currentIndex())
+
     def show_tree_view(self):
-        selected = self.tree.currentItem()
-        if not selected:
+        category_id = self.selected_category_id()
+        if category_id is None:
             QMessageBox.warning(self, "Ошибка", "Выберите категорию")
             return
 
-        category_id = selected.data(0, 100)
         from ui.tree_view_window import TreeViewWindow
         self.tree_window = TreeViewWindow(category_id, self)
         self.tree_window.show()
 
     def edit_category(self):
-        selected = self.tree.currentItem()
-        if not selected:
+        category_id = self.selected_category_id()
+        if category_id is None:
             QMessageBox.warning(self, "Ошибка", "Выберите категорию для редактирования")
             return
 
-        category_id = selected.data(0, 100)
         category = Category.get_by_id(category_id)
 
         dialog = CategoryDialog(
@@ -98,19 +110,16 @@ class MainWindow(QMainWindow):
                 return
 
             Category.update(category_id, data["name"], data["description"])
-            self.load_categories()
 
         elif result == 2:  # Код для удаления
             Category.delete(category_id)
-            self.load_categories()
 
     def delete_category(self):
-        selected = self.tree.currentItem()
-        if not selected:
+        category_id = self.selected_category_id()
+        if category_id is None:
             QMessageBox.warning(self, "Ошибка", "Выберите категорию для удаления")
             return
 
-        category_id = selected.data(0, 100)
         category = Category.get_by_id(category_id)
 
         confirm = QMessageBox.question(
@@ -121,20 +130,18 @@ class MainWindow(QMainWindow):
         )
 
         if confirm == QMessageBox.StandardButton.Yes:
-            if Category.delete(category_id):
-                self.load_categories()
-            else:
+            if not Category.delete(category_id):
                 QMessageBox.warning(self, "Ошибка", "Не удалось удалить категорию")
 
-    def load_categories(self):
-        self.tree.clear()
-        categories = Category.get_children()
+    def dump_sql_stats(self):
+        if not instrumentation.enabled:
+            self.statusBar().showMessage("Профилирование SQL выключено (KNOWLEDGE_SQL_PROFILE=1)")
+            return
+        dump_instrumentation()
+        self.statusBar().showMessage("Статистика SQL выведена в stderr")
 
-        for category in categories:
-            item = QTreeWidgetItem(self.tree)
-            item.setText(0, category.name)
-            item.setText(1, category.description or "")
-            item.setData(0, 100, category.id)
+    def load_categories(self):
+        self.model.reload()
 
     def add_category(self):
         dialog = CategoryDialog(self, "Добавить категорию")
@@ -145,18 +152,21 @@ class MainWindow(QMainWindow):
                 return
 
             Category.create(data["name"], data["description"])
-            self.load_categories()
 
     def open_selected_category(self):
-        selected = self.tree.currentItem()
-        if not selected:
+        category_id = self.selected_category_id()
+        if category_id is None:
             return
 
-        category_id = selected.data(0, 100)
         self.category_window = CategoryWindow(category_id, self)
         self.category_window.show()
+        self.model.cancel()
         self.hide()
 
     def show_main_window(self):
         self.show()
         self.load_categories()
+
+    def closeEvent(self, event):
+        self.model.close()
+        super().closeEvent(event)
@@ -1,10 +1,13 @@
+from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QTreeWidget, QTreeWidgetItem,
-    QPushButton, QLabel, QMessageBox
+    QMainWindow, QWidget, QVBoxLayout, QTreeView,
+    QPushButton, QLabel, QMessageBox, QProgressDialog
 )
 from PyQt6.QtGui import QIcon
 from models.category import Category
-from utils.tree_utils import build_category_tree
+from ui.category_tree_model import CategoryTreeModel, enable_drag_move, enable_lazy_fetch
+from ui.workers import TaskRunner, bind_model_status
+from utils.tree_export import export_tree
 
 
 class TreeViewWindow(QMainWindow):
@@ -12,6 +15,7 @@ class TreeViewWindow(QMainWindow):
         super().__init__(parent)
         self.category_id = category_id
         self.category = Category.get_by_id(category_id)
+        self.runner = TaskRunner(self)
 
         self.setWindowTitle(f"Tree View: {self.category.name}")
         self.setGeometry(200, 200, 600, 800)
@@ -30,8 +34,16 @@ class TreeViewWindow(QMainWindow):
         self.title_label.setStyleSheet("font-weight: bold; font-size: 14px;")
         self.layout.addWidget(self.title_label)
 
-        self.tree_widget = QTreeWidget()
-        self.tree_widget.setHeaderLabels(["Category", "Description"])
+        self.model = CategoryTreeModel(
+            self.category_id, headers=("Category", "Description"), include_root=True, threaded=True
+        )
+        self.model.rowsInserted.connect(self.expand_root)
+        bind_model_status(self, self.model)
+        self.tree_widget = QTreeView()
+        self.tree_widget.setUniformRowHeights(True)
+        self.tree_widget.setModel(self.model)
+        enable_drag_move(self.tree_widget)
+        enable_lazy_fetch(self.tree_widget)
         self.tree_widget.setColumnWidth(0, 300)
         self.layout.addWidget(self.tree_widget)
 
@@ -51,44 +63,36 @@ class TreeViewWindow(QMainWindow):
             self,
             "Save Tree As",
             f"{self.category.name}_tree.txt",
-            "Text Files (*.txt)"
+            "Text Files (*.txt);;Markdown (*.md);;JSON Lines (*.jsonl);;OPML (*.opml);;Graphviz (*.dot)"
         )
 
-        if file_path:
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(f"Knowledge Tree: {self.category.name}\n")
-                    f.write("=" * 50 + "\n\n")
-                    self._write_tree_to_file(f, self.category_id)
-                QMessageBox.information(self, "Success", "Tree exported successfully!")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to export: {str(e)}")
-
-    def _write_tree_to_file(self, file, category_id, level=0):
-        category = Category.get_by_id(category_id)
-        indent = "    " * level
-        file.write(f"{indent}└── {category.name}\n")
-        if category.description:
-            file.write(f"{indent}    Description: {category.description}\n")
-
-        for child in Category.get_children(category_id):
-            self._write_tree_to_file(file, child.id, level + 1)
+        if not file_path:
+            return
 
-    def load_full_tree(self):
-        self.tree_widget.clear()
+        progress = QProgressDialog("Экспорт...", "Отмена", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(500)
 
-        root_item = QTreeWidgetItem(self.tree_widget)
-        root_item.setText(0, self.category.name)
-        root_item.setText(1, self.category.description or "")
+        task = self.runner.submit(
+            export_tree, self.category_id, file_path,
+            on_result=lambda stats: QMessageBox.information(
+                self, "Success", f"Tree exported successfully! ({stats['node_count']} nodes)"
+            ),
+            on_error=lambda message: QMessageBox.critical(self, "Error", f"Failed to export: {message}"),
+            on_progress=lambda count: progress.setLabelText(f"Экспортировано узлов: {count}")
+        )
+        progress.canceled.connect(task.cancel)
+        task.signals.done.connect(progress.reset)
 
-        self._add_children_to_tree(root_item, self.category_id)
+    def load_full_tree(self):
+        # Дети подгружаются пачками при раскрытии узла, в фоновом потоке
+        self.model.reload()
 
-        self.tree_widget.expandAll()
+    def expand_root(self, parent, first, last):
+        if not parent.isValid():
+            self.tree_widget.expand(self.model.index(0, 0))
 
-    def _add_children_to_tree(self, parent_item, category_id):
-        children = Category.get_children(category_id)
-        for child in children:
-            child_item = QTreeWidgetItem(parent_item)
-            child_item.setText(0, child.name)
-            child_item.setText(1, child.description or "")
-            self._add_children_to_tree(child_item, child.id)
+    def closeEvent(self, event):
+        self.runner.cancel_all()
+        self.model.close()
+        super().closeEvent(event)
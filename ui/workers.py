@@ -0,0 +1,103 @@
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from db.database import get_connection, operation, release_connection
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskSignals(QObject):
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    progress = pyqtSignal(int)
+    done = pyqtSignal()
+
+
+class DatabaseTask(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.name = f"task.{getattr(fn, '__module__', None)}.{getattr(fn, '__qualname__', repr(fn))}"
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+        self._cancelled = threading.Event()
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            if self._connection is not None:
+                # Прерывает выполняющийся запрос в потоке задачи
+                self._connection.interrupt()
+
+    def report_progress(self, value):
+        if self.cancelled:
+            raise TaskCancelled()
+        self.signals.progress.emit(value)
+
+    def run(self):
+        try:
+            if self.cancelled:
+                return
+            with self._lock:
+                self._connection = get_connection()
+            with operation(self.name):
+                result = self.fn(*self.args, **self.kwargs)
+            if not self.cancelled:
+                self.signals.result.emit(result)
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.error.emit(str(e))
+        finally:
+            with self._lock:
+                self._connection = None
+            release_connection()
+            self.signals.done.emit()
+
+
+class TaskRunner(QObject):
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self.tasks = set()
+
+    def submit(self, fn, *args, on_result=None, on_error=None, on_progress=None, **kwargs):
+        task = DatabaseTask(fn, *args, **kwargs)
+        if on_progress is not None:
+            task.kwargs['progress'] = task.report_progress
+            task.signals.progress.connect(on_progress)
+        if on_result is not None:
+            task.signals.result.connect(on_result)
+        if on_error is not None:
+            task.signals.error.connect(on_error)
+        task.signals.done.connect(lambda: self.tasks.discard(task))
+
+        self.tasks.add(task)
+        self.pool.start(task)
+        return task
+
+    def cancel_all(self):
+        # Ссылки держим до сигнала done: пул может ещё выполнять задачу
+        for task in list(self.tasks):
+            task.cancel()
+
+
+def bind_model_status(window, model):
+    def show_loading(loading):
+        if loading:
+            window.statusBar().showMessage("Загрузка...")
+        else:
+            window.statusBar().clearMessage()
+
+    model.loading_changed.connect(show_loading)
+    model.load_failed.connect(lambda message: window.statusBar().showMessage(f"Ошибка загрузки: {message}"))
+    model.move_failed.connect(lambda message: window.statusBar().showMessage(f"Перенос невозможен: {message}"))
@@ -0,0 +1,115 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+
+from db.database import operation
+from models.category import Category
+from utils import tree_utils
+
+# Каждый поток исполнителя держит своё соединение из пула: число соединений фиксировано
+ASYNC_WORKERS = 4
+
+
+def _call(name, fn, args, kwargs):
+    with operation(name):
+        return fn(*args, **kwargs)
+
+
+def _blocking(fn):
+    name = fn.__qualname__
+
+    @functools.wraps(fn)
+    async def method(self, *args, **kwargs):
+        return await self._run(name, fn, *args, **kwargs)
+    return method
+
+
+class AsyncCategoryRepository:
+    def __init__(self, max_workers: int = ASYNC_WORKERS, max_concurrency: Optional[int] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='category-db')
+        self._limit = max_concurrency or max_workers
+        self._semaphore = None
+        self._pending = {}
+        self._flush_scheduled = False
+
+    async def _run(self, name, fn, *args, **kwargs):
+        # Семафор создаётся в цикле событий, который им пользуется
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._limit)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, _call, name, fn, args, kwargs)
+
+    async def get_by_id(self, category_id: int) -> Optional[Category]:
+        # Запросы одного такта цикла событий собираются в один SELECT ... IN (...)
+        loop = asyncio.get_running_loop()
+        future = self._pending.get(category_id)
+        if future is None:
+            future = self._pending[category_id] = loop.create_future()
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                loop.call_soon(lambda: loop.create_task(self._flush()))
+        return await asyncio.shield(future)
+
+    async def get_by_ids(self, category_ids) -> Dict[int, Category]:
+        categories = await asyncio.gather(*(self.get_by_id(category_id) for category_id in category_ids))
+        return {category.id: category for category in categories if category is not None}
+
+    async def _flush(self):
+        pending, self._pending = self._pending, {}
+        self._flush_scheduled = False
+        try:
+            found = await self._run('Category.get_by_ids', Category.get_by_ids, list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for category_id, future in pending.items():
+            if not future.done():
+                future.set_result(found.get(category_id))
+
+    create = _blocking(Category.create)
+    update = _blocking(Category.update)
+    delete = _blocking(Category.delete)
+    move = _blocking(Category.move)
+    move_many = _blocking(Category.move_many)
+    get_children = _blocking(Category.get_children)
+    get_children_batch = _blocking(Category.get_children_batch)
+    get_children_page = _blocking(Category.get_children_page)
+    get_subtree_rows = _blocking(Category.get_subtree_rows)
+    get_ancestors = _blocking(Category.get_ancestors)
+    get_descendants = _blocking(Category.get_descendants)
+    is_descendant = _blocking(Category.is_descendant)
+    get_all = _blocking(Category.get_all)
+
+    build_category_tree = _blocking(tree_utils.build_category_tree)
+    get_category_path = _blocking(tree_utils.get_category_path)
+    get_category_paths = _blocking(tree_utils.get_category_paths)
+    get_all_descendants = _blocking(tree_utils.get_all_descendants)
+    calculate_tree_depth = _blocking(tree_utils.calculate_tree_depth)
+    count_tree_nodes = _blocking(tree_utils.count_tree_nodes)
+    find_category_by_name = _blocking(tree_utils.find_category_by_name)
+    is_ancestor = _blocking(tree_utils.is_ancestor)
+    get_tree_statistics = _blocking(tree_utils.get_tree_statistics)
+
+    async def iter_children(self, parent_id: Optional[int] = None, page_size: int = 500,
+                            sort: str = 'name', descending: bool = False) -> AsyncIterator[List[Category]]:
+        after = None
+        while True:
+            page, after = await self.get_children_page(parent_id, after, page_size, sort, descending)
+            if page:
+                yield page
+            if after is None:
+                return
+
+    def close(self):
+        # Соединения завершившихся потоков пул заберёт сам при следующем запросе
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,65 @@
+import re
+from typing import Dict, List
+
+from db.database import get_connection, has_fts, operation
+from models.path_cache import path_cache
+
+
+def _build_match(query: str, prefix: bool) -> str:
+    terms = re.findall(r'\w+', query)
+    suffix = '*' if prefix else ''
+    return ' '.join(f'"{term}"{suffix}' for term in terms)
+
+
+def _attach_paths(results: List[Dict]):
+    paths = path_cache.get_path_rows(result['id'] for result in results)
+    for result in results:
+        path = paths.get(result['id'], ())[:-1]
+        result['path'] = [{'id': row[0], 'name': row[1]} for row in path]
+
+
+@operation()
+def search_categories(query: str, limit: int = 20, offset: int = 0, prefix: bool = True) -> List[Dict]:
+    match = _build_match(query, prefix)
+    if not match:
+        return []
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if has_fts(conn):
+            cursor.execute("""
+                SELECT c.id, c.name, c.description, c.parent_id,
+                       bm25(categories_fts, 10.0, 1.0) AS rank,
+                       highlight(categories_fts, 0, '[', ']'),
+                       snippet(categories_fts, 1, '[', ']', '…', 12)
+                FROM categories_fts
+                JOIN categories c ON c.id = categories_fts.rowid
+                WHERE categories_fts MATCH ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            """, (match, limit, offset))
+        else:
+            pattern = f"%{query.strip()}%"
+            cursor.execute("""
+                SELECT id, name, description, parent_id, 0, name, COALESCE(description, '')
+                FROM categories
+                WHERE name LIKE ? OR description LIKE ?
+                ORDER BY id
+                LIMIT ? OFFSET ?
+            """, (pattern, pattern, limit, offset))
+
+        results = [
+            {
+                'id': category_id,
+                'name': name,
+                'description': description,
+                'parent_id': parent_id,
+                'rank': rank,
+                'name_highlight': name_highlight,
+                'description_snippet': description_snippet
+            }
+            for category_id, name, description, parent_id, rank, name_highlight, description_snippet
+            in cursor.fetchall()
+        ]
+    _attach_paths(results)
+    return results
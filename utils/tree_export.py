@@ -0,0 +1,244 @@
+import json
+from itertools import chain
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, TextIO, Tuple
+
+from db.database import get_connection, operation
+from models import change_log
+from utils.tree_traversal import ProgressVisitor, StatisticsVisitor, run
+
+Row = Tuple[int, str, Optional[str], Optional[int], int]
+
+# Вместо xml.sax.saxutils: он импортирует urllib и заметно замедляет запуск cli.py
+_XML_TEXT = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+_XML_ATTR = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'
+})
+
+
+def _escape(text: str) -> str:
+    return text.translate(_XML_TEXT)
+
+
+def _quoteattr(text: str) -> str:
+    return '"' + text.translate(_XML_ATTR) + '"'
+
+
+def iter_subtree(category_id: Optional[int]) -> Iterator[Row]:
+    # Очередь рекурсивного CTE упорядочена по глубине: строки приходят в порядке обхода в глубину.
+    # Для category_id = None обходится весь лес от корневых категорий
+    root_filter = "parent_id IS NULL" if category_id is None else "id = :root"
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            WITH RECURSIVE subtree(id, name, description, parent_id, depth) AS (
+                SELECT id, name, description, parent_id, 0
+                FROM categories
+                WHERE {root_filter}
+                UNION ALL
+                SELECT c.id, c.name, c.description, c.parent_id, s.depth + 1
+                FROM categories c
+                JOIN subtree s ON c.parent_id = s.id
+                ORDER BY 5 DESC, 1
+            )
+            SELECT id, name, description, parent_id, depth FROM subtree
+        """, {'root': category_id})
+        yield from cursor
+
+
+class TextWriter:
+    def __init__(self, file: TextIO):
+        self.file = file
+
+    def start(self, root: Row):
+        _, name, description, _, _ = root
+        self.file.write(f"KNOWLEDGE TREE: {name}\n")
+        self.file.write("=" * 60 + "\n\n")
+        if description:
+            self.file.write(f"Root Description: {description}\n\n")
+        self.file.write("TREE STRUCTURE:\n")
+
+    def node(self, row: Row):
+        category_id, name, description, _, depth = row
+        indent = "    " * depth
+        self.file.write(f"{indent}└── {name} (ID: {category_id})\n")
+        if description:
+            self.file.write(f"{indent}    Description: {description}\n")
+
+    def finish(self, stats: Dict):
+        self.file.write("\nSTATISTICS:\n")
+        self.file.write(f"- Total nodes: {stats['node_count']}\n")
+        self.file.write(f"- Tree depth: {stats['depth']}\n")
+        self.file.write(f"- Leaf nodes: {stats['leaf_count']}\n")
+        self.file.write(f"- Branch nodes: {stats['branch_count']}\n")
+
+
+class MarkdownWriter:
+    def __init__(self, file: TextIO):
+        self.file = file
+
+    def start(self, root: Row):
+        _, name, description, _, _ = root
+        self.file.write(f"# {name}\n\n")
+        if description:
+            self.file.write(f"{description}\n\n")
+
+    def node(self, row: Row):
+        _, name, description, _, depth = row
+        if depth == 0:
+            return
+        indent = "  " * (depth - 1)
+        self.file.write(f"{indent}- **{name}**\n")
+        if description:
+            for line in description.splitlines():
+                self.file.write(f"{indent}  {line}\n")
+
+    def finish(self, stats: Dict):
+        self.file.write(
+            f"\n---\n\nNodes: {stats['node_count']}, depth: {stats['depth']}, "
+            f"leaves: {stats['leaf_count']}, branches: {stats['branch_count']}\n"
+        )
+
+
+class JsonLinesWriter:
+    def __init__(self, file: TextIO):
+        self.file = file
+
+    def start(self, root: Row):
+        pass
+
+    def node(self, row: Row):
+        category_id, name, description, parent_id, depth = row
+        self.file.write(json.dumps({
+            'id': category_id,
+            'name': name,
+            'description': description,
+            'parent_id': parent_id,
+            'depth': depth
+        }, ensure_ascii=False) + "\n")
+
+    def finish(self, stats: Dict):
+        pass
+
+
+class OpmlWriter:
+    def __init__(self, file: TextIO):
+        self.file = file
+        self.open_depth = 0
+
+    def _close_to(self, depth: int):
+        while self.open_depth > depth:
+            self.open_depth -= 1
+            self.file.write("  " * (self.open_depth + 2) + "</outline>\n")
+
+    def start(self, root: Row):
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n<opml version="2.0">\n')
+        self.file.write(f"  <head>\n    <title>{_escape(root[1])}</title>\n  </head>\n  <body>\n")
+
+    def node(self, row: Row):
+        _, name, description, _, depth = row
+        self._close_to(depth)
+        note = f" _note={_quoteattr(description)}" if description else ""
+        self.file.write("  " * (depth + 2) + f"<outline text={_quoteattr(name)}{note}>\n")
+        self.open_depth = depth + 1
+
+    def finish(self, stats: Dict):
+        self._close_to(0)
+        self.file.write("  </body>\n</opml>\n")
+
+
+class DotWriter:
+    def __init__(self, file: TextIO):
+        self.file = file
+
+    @staticmethod
+    def _quote(text: str) -> str:
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+    def start(self, root: Row):
+        self.file.write(f"digraph {self._quote(root[1])} {{\n    node [shape=box];\n")
+
+    def node(self, row: Row):
+        category_id, name, _, parent_id, depth = row
+        self.file.write(f"    n{category_id} [label={self._quote(name)}];\n")
+        if depth > 0:
+            self.file.write(f"    n{parent_id} -> n{category_id};\n")
+
+    def finish(self, stats: Dict):
+        self.file.write("}\n")
+
+
+WRITERS = {
+    'text': TextWriter,
+    'markdown': MarkdownWriter,
+    'jsonl': JsonLinesWriter,
+    'opml': OpmlWriter,
+    'dot': DotWriter,
+}
+
+SUFFIXES = {
+    '.txt': 'text',
+    '.md': 'markdown',
+    '.jsonl': 'jsonl',
+    '.opml': 'opml',
+    '.dot': 'dot',
+    '.gv': 'dot',
+}
+
+
+PROGRESS_STEP = 1000
+
+
+class _NodeVisitor:
+    # Подключает writer к общему проходу: статистика и вывод считаются по одному потоку строк
+    done = False
+
+    def __init__(self, writer):
+        self.visit = writer.node
+
+    def finish(self):
+        return None
+
+
+def write_tree(category_id: int, file: TextIO, format: str = 'text',
+               progress: Optional[Callable[[int], None]] = None) -> Dict:
+    writer = WRITERS[format](file)
+    rows = iter_subtree(category_id)
+
+    root = next(rows, None)
+    if root is None:
+        raise ValueError(f"Category {category_id} not found")
+
+    writer.start(root)
+    visitors = [StatisticsVisitor(), _NodeVisitor(writer)]
+    if progress:
+        visitors.append(ProgressVisitor(progress, PROGRESS_STEP))
+    result = run(chain((root,), rows), visitors)[0]
+    writer.finish(result)
+    return result
+
+
+@operation()
+def export_tree(category_id: int, file_path: str, format: Optional[str] = None,
+                progress: Optional[Callable[[int], None]] = None) -> Dict:
+    format = format or SUFFIXES.get(Path(file_path).suffix.lower(), 'text')
+    try:
+        with open(file_path, 'w', encoding='utf-8') as file:
+            return write_tree(category_id, file, format, progress)
+    except Exception:
+        Path(file_path).unlink(missing_ok=True)
+        raise
+
+
+@operation()
+def write_changes(since: int, file: TextIO, progress: Optional[Callable[[int], None]] = None) -> int:
+    # Дельта для синхронизации в JSON Lines; возвращает ревизию, с которой продолжать в следующий раз.
+    # Верхняя граница фиксируется заранее, чтобы записи, сделанные во время выгрузки, не разорвали курсор
+    until = change_log.current_revision()
+    revision = since
+    for count, change in enumerate(change_log.iter_changes(since, until=until), 1):
+        file.write(json.dumps(change, ensure_ascii=False) + "\n")
+        revision = change['revision']
+        if progress and count % PROGRESS_STEP == 0:
+            progress(count)
+    return max(revision, until)
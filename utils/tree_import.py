@@ -0,0 +1,271 @@
+import csv
+import json
+import re
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterator, Optional, TextIO, Tuple
+
+from db.database import after_commit, operation, session
+from models import change_log, events, tree_stats
+from models.tree_index import tree_index
+
+Row = Tuple[int, str, Optional[str], Optional[int]]
+
+READ_SIZE = 1 << 16
+
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+_LITERALS = {'true': True, 'false': False, 'null': None}
+_TEXT_NODE = re.compile(r'^(?P<indent> *)└── (?P<name>.*?)(?: \(ID: \d+\))?$')
+_TEXT_DESCRIPTION = re.compile(r'^ *Description: (?P<text>.*)$')
+
+
+def _json_events(file: TextIO) -> Iterator[Tuple[str, object]]:
+    # Потоковый разбор JSON: в памяти только текущий кусок файла и стек контейнеров
+    buffer = ''
+    pos = 0
+    eof = False
+    containers = []
+
+    def value_done():
+        if containers and containers[-1][0] == 'map':
+            containers[-1][1] = True
+
+    while True:
+        if pos >= len(buffer) or (not eof and len(buffer) - pos < 64):
+            chunk = '' if eof else file.read(READ_SIZE)
+            eof = eof or not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            if not buffer:
+                break
+
+        char = buffer[pos]
+        if char in ' \t\r\n,:':
+            pos += 1
+        elif char in '{[':
+            kind = 'map' if char == '{' else 'array'
+            containers.append([kind, True])
+            yield 'start_' + kind, None
+            pos += 1
+        elif char in '}]':
+            kind = containers.pop()[0]
+            yield 'end_' + kind, None
+            value_done()
+            pos += 1
+        elif char == '"':
+            try:
+                text, end = json.decoder.scanstring(buffer, pos + 1)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = file.read(READ_SIZE)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            pos = end
+            if containers and containers[-1] == ['map', True]:
+                containers[-1][1] = False
+                yield 'key', text
+            else:
+                yield 'value', text
+                value_done()
+        else:
+            match = _NUMBER.match(buffer, pos)
+            if match:
+                number = match.group()
+                yield 'value', float(number) if any(c in number for c in '.eE') else int(number)
+                pos = match.end()
+            else:
+                for literal, literal_value in _LITERALS.items():
+                    if buffer.startswith(literal, pos):
+                        yield 'value', literal_value
+                        pos += len(literal)
+                        break
+                else:
+                    raise ValueError(f"Unexpected character {char!r} in JSON input")
+            value_done()
+
+
+def _nested_rows(nodes: Iterator[Tuple[int, str, Optional[str]]], start_id: int,
+                 parent_id: Optional[int]) -> Iterator[Row]:
+    path = []
+    next_id = start_id
+    for depth, name, description in nodes:
+        if depth > len(path):
+            raise ValueError(f"Category '{name}' is nested deeper than its parent")
+        del path[depth:]
+        yield next_id, name, description, path[-1] if path else parent_id
+        path.append(next_id)
+        next_id += 1
+
+
+def _json_rows(file: TextIO, start_id: int, parent_id: Optional[int]) -> Iterator[Row]:
+    # Строка узла нужна раньше его детей, поэтому пишется при начале "children".
+    # Ключи после "children" (sort_keys и т. п.) дописывают её повторно с тем же id, когда объект закрыт
+    contexts = []
+    frames = []
+    key = None
+    skip = 0
+    next_id = start_id
+
+    def row(frame):
+        return frame['id'], frame['name'] or '', frame['description'], frame['parent_id']
+
+    for event, value in _json_events(file):
+        if skip:
+            if event in ('start_map', 'start_array'):
+                skip += 1
+            elif event in ('end_map', 'end_array'):
+                skip -= 1
+            continue
+
+        top = contexts[-1] if contexts else None
+        if event == 'start_array':
+            if top is None:
+                contexts.append('nodes')
+            elif top == 'node' and key == 'children':
+                frame = frames[-1]
+                if frame['written'] is None:
+                    frame['written'] = (frame['name'], frame['description'])
+                    yield row(frame)
+                contexts.append('nodes')
+            else:
+                skip = 1
+        elif event == 'start_map':
+            if top in (None, 'nodes'):
+                contexts.append('node')
+                frames.append({'id': next_id, 'parent_id': frames[-1]['id'] if frames else parent_id,
+                               'name': None, 'description': None, 'written': None})
+                next_id += 1
+            else:
+                skip = 1
+        elif event == 'key':
+            key = value
+        elif event == 'value':
+            if top != 'node':
+                raise ValueError("Expected a category object in JSON input")
+            if key == 'name':
+                frames[-1]['name'] = value
+            elif key == 'description':
+                frames[-1]['description'] = value
+        elif event == 'end_map':
+            frame = frames.pop()
+            contexts.pop()
+            if not frame['name']:
+                raise ValueError("Category without 'name' in JSON input")
+            if frame['written'] != (frame['name'], frame['description']):
+                yield row(frame)
+        elif event == 'end_array':
+            contexts.pop()
+
+
+def _text_nodes(file: TextIO) -> Iterator[Tuple[int, str, Optional[str]]]:
+    pending = None
+    in_tree = True
+    for line in file:
+        line = line.rstrip('\n')
+        if line == 'TREE STRUCTURE:':
+            in_tree = True
+            continue
+        if line == 'STATISTICS:':
+            in_tree = False
+            continue
+        if not in_tree or not line.strip():
+            continue
+
+        node = _TEXT_NODE.match(line)
+        if node:
+            if pending:
+                yield pending
+            pending = (len(node.group('indent')) // 4, node.group('name'), None)
+            continue
+        if pending is None:
+            # Заголовок файла до первого узла
+            continue
+        description = _TEXT_DESCRIPTION.match(line)
+        depth, name, current = pending
+        if description and current is None:
+            pending = (depth, name, description.group('text'))
+        elif current is not None:
+            pending = (depth, name, current + '\n' + line.strip())
+
+    if pending:
+        yield pending
+
+
+def _csv_rows(file: TextIO, start_id: int, parent_id: Optional[int]) -> Iterator[Row]:
+    ids = {}
+    next_id = start_id
+    for line_number, record in enumerate(csv.DictReader(file), start=2):
+        parent_ref = (record.get('parent_id') or '').strip()
+        if parent_ref and parent_ref not in ids:
+            raise ValueError(f"Line {line_number}: parent '{parent_ref}' must appear before its children")
+        ids[(record.get('id') or str(next_id)).strip()] = next_id
+        yield next_id, record['name'], record.get('description') or None, ids[parent_ref] if parent_ref else parent_id
+        next_id += 1
+
+
+FORMATS = {
+    'json': _json_rows,
+    'text': lambda file, start_id, parent_id: _nested_rows(_text_nodes(file), start_id, parent_id),
+    'csv': _csv_rows,
+}
+
+SUFFIXES = {'.json': 'json', '.txt': 'text', '.csv': 'csv'}
+
+
+def _next_id(cursor) -> int:
+    cursor.execute("""
+        SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'categories'), 0),
+            COALESCE((SELECT MAX(id) FROM categories), 0)
+        ) + 1
+    """)
+    return cursor.fetchone()[0]
+
+
+@operation()
+def import_tree(file_path: str, format: Optional[str] = None, parent_id: Optional[int] = None,
+                chunk_size: int = 5000, progress: Optional[Callable[[int], None]] = None) -> int:
+    format = format or SUFFIXES.get(Path(file_path).suffix.lower())
+    if format not in FORMATS:
+        raise ValueError(f"Unknown import format for {file_path}")
+
+    imported = 0
+    top_level = []
+    # newline='' нужен только csv; текст читается с универсальными переводами строк, иначе \r из CRLF попадёт в имена
+    newline = '' if format == 'csv' else None
+    with open(file_path, encoding='utf-8', newline=newline) as file, session() as conn, change_log.own_changes():
+        cursor = conn.cursor()
+        last_id = _next_id(cursor) - 1
+        rows = FORMATS[format](file, last_id + 1, parent_id)
+
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            # id выдаются по возрастанию: строка с уже выданным id — дописанный узел, а не новый
+            cursor.executemany(
+                """
+                INSERT INTO categories (id, name, description, parent_id) VALUES (?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET name = excluded.name, description = excluded.description
+                """,
+                chunk
+            )
+            for row in chunk:
+                if row[0] > last_id:
+                    last_id = row[0]
+                    imported += 1
+                    if row[3] == parent_id:
+                        top_level.append(row[0])
+            if progress:
+                progress(imported)
+
+        for category_id in top_level:
+            tree_stats.rebuild_subtree(cursor, category_id, parent_id)
+        if imported:
+            tree_index.stage('invalidate')
+            after_commit(partial(events.publish, events.RESET))
+    return imported
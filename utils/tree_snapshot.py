@@ -0,0 +1,131 @@
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+from typing import Dict, List, Optional
+
+from utils.tree_export import iter_subtree
+
+
+class TreeSnapshot:
+    # Неизменяемый снимок поддерева: параллельные массивы в порядке обхода в глубину.
+    # Поддерево узла i занимает позиции [i, i + sizes[i])
+    __slots__ = (
+        'ids', 'parents', 'depths', 'sizes', 'child_counts', 'child_offsets', 'children',
+        'names', 'descriptions', '_leaf_prefix', '_branch_prefix', '_sorted_ids', '_sorted_positions'
+    )
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        self.parents = array('q')
+        self.depths = array('l')
+        self.names = []
+        self.descriptions = []
+
+        path = []
+        for category_id, name, description, _, depth in rows:
+            del path[depth:]
+            self.parents.append(path[-1] if path else -1)
+            path.append(len(self.ids))
+            self.ids.append(category_id)
+            self.depths.append(depth)
+            self.names.append(sys.intern(name))
+            self.descriptions.append(sys.intern(description) if description else None)
+
+        count = len(self.ids)
+        self.sizes = array('q', [1]) * count
+        self.child_counts = child_counts = array('q', [0]) * count
+        for position in range(count - 1, -1, -1):
+            parent = self.parents[position]
+            if parent >= 0:
+                self.sizes[parent] += self.sizes[position]
+                child_counts[parent] += 1
+
+        self.child_offsets = array('q', accumulate(child_counts, initial=0))
+        self.children = array('q', [0]) * count
+        fill = array('q', self.child_offsets[:-1] if count else [])
+        for position in range(count):
+            parent = self.parents[position]
+            if parent >= 0:
+                self.children[fill[parent]] = position
+                fill[parent] += 1
+
+        self._leaf_prefix = array('q', accumulate((c == 0 for c in child_counts), initial=0))
+        self._branch_prefix = array('q', accumulate((c > 1 for c in child_counts), initial=0))
+
+        order = sorted(range(count), key=self.ids.__getitem__)
+        self._sorted_ids = array('q', (self.ids[i] for i in order))
+        self._sorted_positions = array('q', order)
+
+    @classmethod
+    def load(cls, category_id: Optional[int] = None) -> 'TreeSnapshot':
+        return cls(iter_subtree(category_id))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, category_id: int) -> int:
+        index = bisect_left(self._sorted_ids, category_id)
+        if index == len(self._sorted_ids) or self._sorted_ids[index] != category_id:
+            raise KeyError(category_id)
+        return self._sorted_positions[index]
+
+    def child_positions(self, position: int) -> array:
+        return self.children[self.child_offsets[position]:self.child_offsets[position + 1]]
+
+    def child_count(self, position: int) -> int:
+        return self.child_counts[position]
+
+    def subtree_count(self, position: int) -> int:
+        return self.sizes[position]
+
+    def leaf_count(self, position: int) -> int:
+        return self._leaf_prefix[position + self.sizes[position]] - self._leaf_prefix[position]
+
+    def branch_count(self, position: int) -> int:
+        return self._branch_prefix[position + self.sizes[position]] - self._branch_prefix[position]
+
+    def height(self, position: int) -> int:
+        end = position + self.sizes[position]
+        return max(self.depths[position:end]) - self.depths[position] + 1
+
+    def statistics(self, category_id: Optional[int] = None) -> Dict:
+        if category_id is None:
+            # Весь снимок: для леса глубина — по самому глубокому корню
+            return {
+                'node_count': len(self.ids),
+                'depth': max(self.depths) + 1 if self.ids else 0,
+                'leaf_count': self._leaf_prefix[-1],
+                'branch_count': self._branch_prefix[-1]
+            }
+        position = self.position(category_id)
+        return {
+            'node_count': self.subtree_count(position),
+            'depth': self.height(position),
+            'leaf_count': self.leaf_count(position),
+            'branch_count': self.branch_count(position)
+        }
+
+    def fanout_histogram(self, category_id: Optional[int] = None) -> Dict[int, int]:
+        if category_id is None:
+            start, end = 0, len(self.ids)
+        else:
+            start = self.position(category_id)
+            end = start + self.sizes[start]
+        return dict(sorted(Counter(self.child_counts[start:end]).items()))
+
+    def depth_histogram(self, category_id: Optional[int] = None) -> Dict[int, int]:
+        if category_id is None:
+            return dict(sorted(Counter(self.depths).items()))
+        start = self.position(category_id)
+        base = self.depths[start]
+        return dict(sorted(Counter(d - base for d in self.depths[start:start + self.sizes[start]]).items()))
+
+    def path(self, category_id: int) -> List[str]:
+        position = self.position(category_id)
+        names = []
+        while position >= 0:
+            names.append(self.names[position])
+            position = self.parents[position]
+        return names[::-1]
@@ -0,0 +1,171 @@
+import sys
+from collections import deque
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from models.category import Category
+from models.tree_index import tree_index
+
+PRE_ORDER = 'pre'
+POST_ORDER = 'post'
+BREADTH_FIRST = 'bfs'
+
+# (id, name, description, parent_id, depth) — тот же формат, что у iter_subtree
+Row = Tuple[int, str, Optional[str], Optional[int], int]
+
+
+def traverse(roots: Iterable[Hashable], children: Callable[[Hashable], Iterable[Hashable]],
+             order: str = PRE_ORDER) -> Iterator[Tuple[Hashable, int]]:
+    # Явный стек вместо рекурсии: глубина дерева ограничена только памятью
+    if order == BREADTH_FIRST:
+        queue = deque((root, 0) for root in roots)
+        while queue:
+            node, depth = queue.popleft()
+            yield node, depth
+            queue.extend((child, depth + 1) for child in children(node))
+    elif order == PRE_ORDER:
+        stack = [(root, 0) for root in reversed(list(roots))]
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            stack.extend((child, depth + 1) for child in reversed(list(children(node))))
+    elif order == POST_ORDER:
+        stack = [(root, 0, False) for root in reversed(list(roots))]
+        while stack:
+            node, depth, expanded = stack.pop()
+            if expanded:
+                yield node, depth
+                continue
+            stack.append((node, depth, True))
+            stack.extend((child, depth + 1, False) for child in reversed(list(children(node))))
+    else:
+        raise ValueError(f"Unknown traversal order: {order}")
+
+
+def iter_rows(category_id: Optional[int] = None, order: str = PRE_ORDER,
+              include_root: bool = True) -> Iterator[Row]:
+    # Обход по индексу в памяти; без include_root корнями становятся дети category_id
+    if category_id is None or not include_root:
+        roots = tree_index.children(category_id)
+    else:
+        roots = [category_id] if tree_index.get(category_id) else []
+    for node_id, depth in traverse(roots, tree_index.children, order):
+        yield (*tree_index.get(node_id), depth)
+
+
+class StatisticsVisitor:
+    # Ожидает строки в прямом порядке обхода в глубину
+    done = False
+
+    def __init__(self):
+        self.node_count = 0
+        self.depth = 0
+        self.leaf_count = 0
+        self.branch_count = 0
+        self._open = []
+
+    def _close(self):
+        children = self._open.pop()
+        if children == 0:
+            self.leaf_count += 1
+        elif children > 1:
+            self.branch_count += 1
+
+    def add(self, depth: int):
+        while len(self._open) > depth:
+            self._close()
+        if self._open:
+            self._open[-1] += 1
+        self._open.append(0)
+        self.node_count += 1
+        self.depth = max(self.depth, depth + 1)
+
+    def visit(self, row: Row):
+        self.add(row[4])
+
+    def finish(self) -> Dict:
+        while self._open:
+            self._close()
+        return {
+            'node_count': self.node_count,
+            'depth': self.depth,
+            'leaf_count': self.leaf_count,
+            'branch_count': self.branch_count
+        }
+
+
+class CollectVisitor:
+    done = False
+
+    def __init__(self, min_depth: int = 0):
+        self.min_depth = min_depth
+        self.categories = []
+
+    def visit(self, row: Row):
+        if row[4] >= self.min_depth:
+            self.categories.append(Category(*row[:4]))
+
+    def finish(self) -> List[Category]:
+        return self.categories
+
+
+class FindVisitor:
+    def __init__(self, predicate: Callable[[Row], bool]):
+        self.predicate = predicate
+        self.found = None
+        self.done = False
+
+    def visit(self, row: Row):
+        if self.found is None and self.predicate(row):
+            self.found = Category(*row[:4])
+            self.done = True
+
+    def finish(self) -> Optional[Category]:
+        return self.found
+
+
+class PrintVisitor:
+    done = False
+
+    def __init__(self, indent: int = 0, file: Optional[TextIO] = None):
+        self.indent = indent
+        self.file = file or sys.stdout
+
+    def visit(self, row: Row):
+        category_id, name, description, _, depth = row
+        indent = self.indent + 4 * depth
+        self.file.write(' ' * indent + f"├── {name} (ID: {category_id})\n")
+        if description:
+            self.file.write(' ' * (indent + 4) + f"Description: {description}\n")
+
+    def finish(self):
+        return None
+
+
+class ProgressVisitor:
+    done = False
+
+    def __init__(self, progress: Callable[[int], None], step: int):
+        self.progress = progress
+        self.step = step
+        self.count = 0
+
+    def visit(self, row: Row):
+        self.count += 1
+        if self.count % self.step == 0:
+            self.progress(self.count)
+
+    def finish(self) -> int:
+        return self.count
+
+
+def run(rows: Iterable[Row], visitors: List) -> List:
+    # Один проход по потоку строк для всех посетителей; обход прекращается, когда все закончили
+    active = list(visitors)
+    for row in rows:
+        for visitor in active:
+            visitor.visit(row)
+        if any(visitor.done for visitor in active):
+            active = [visitor for visitor in active if not visitor.done]
+            if not active:
+                break
+    return [visitor.finish() for visitor in visitors]